@@ -1,20 +1,52 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+import asyncio
 import httpx
+import hashlib
 import os
+import threading
 import time
 import logging
-from typing import Optional
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Connection pool tuning for the proxy clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "2000"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "500"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create pooled HTTP clients once and reuse them for every proxied call"""
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    # HTTP/2 is negotiated over TLS; plain-http backends keep using HTTP/1.1
+    app.state.http = httpx.AsyncClient(timeout=httpx.Timeout(30.0), limits=limits, http2=HTTP2_ENABLED)
+    # Uploads (audio, documents) get a longer timeout tier
+    app.state.http_upload = httpx.AsyncClient(timeout=httpx.Timeout(60.0), limits=limits, http2=HTTP2_ENABLED)
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        await app.state.http_upload.aclose()
+
 app = FastAPI(
     title="Cloud Learning Platform API Gateway",
     description="Unified API Gateway for the Cloud-Based Learning Platform",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for frontend
@@ -35,31 +67,87 @@ SERVICES = {
     "quiz": os.getenv("QUIZ_SERVICE_URL", "http://quiz-service:8005"),
 }
 
+# Maximum sub-requests accepted by /batch
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
 # JWT Configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "learning-platform-secret-key-2025")
 JWT_ALGORITHM = "HS256"
 
+# Recently verified tokens, keyed by SHA-256 of the token (only successes are cached)
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "5"))
+_jwt_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL)
+_jwt_cache_lock = threading.Lock()
+
 def verify_token(token: str) -> bool:
     """Mock JWT verification - in a real app, use pyjwt to decode and verify"""
     # For demonstration/Phase 3 compliance: any non-empty token is accepted
     return len(token) > 10
 
+def verify_token_cached(token: str) -> bool:
+    """Verify a token, skipping re-verification of recently accepted tokens"""
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _jwt_cache_lock:
+        expires_at = _jwt_cache.get(key)
+    if expires_at is not None and expires_at > now:
+        return True
+    
+    if not verify_token(token):
+        return False
+    
+    # Once real decoding is in place, cap this with the token's own "exp" claim
+    with _jwt_cache_lock:
+        _jwt_cache[key] = now + JWT_CACHE_TTL
+    return True
+
+# Rate limiting: in-process token bucket per client IP, sharded to keep dicts small
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_SHARDS = 16
+RATE_LIMIT_SHARD_MAX = 10_000  # Entries per shard before idle buckets are pruned
+_rate_buckets: list = [{} for _ in range(RATE_LIMIT_SHARDS)]
+
+def check_rate_limit(client_ip: str) -> bool:
+    """Token bucket check - returns False when the client has no tokens left"""
+    now = time.monotonic()
+    bucket = _rate_buckets[hash(client_ip) & (RATE_LIMIT_SHARDS - 1)]
+
+    tokens, last = bucket.get(client_ip, (RATE_LIMIT_BURST, now))
+    tokens = min(RATE_LIMIT_BURST, tokens + (now - last) * RATE_LIMIT_PER_SECOND)
+    if tokens < 1:
+        bucket[client_ip] = (tokens, now)
+        return False
+    bucket[client_ip] = (tokens - 1, now)
+
+    if len(bucket) > RATE_LIMIT_SHARD_MAX:
+        # Buckets idle long enough to have refilled completely carry no state
+        idle = RATE_LIMIT_BURST / RATE_LIMIT_PER_SECOND
+        for ip in [ip for ip, (_, ts) in bucket.items() if now - ts >= idle]:
+            del bucket[ip]
+    return True
+
+# Paths served without rate limiting or a JWT
+PUBLIC_PATHS = frozenset({"/", "/health", "/services/status", "/docs", "/openapi.json"})
+
 @app.middleware("http")
 async def security_and_logging_middleware(request: Request, call_next):
     """Unified middleware for Security (JWT), Rate Limiting, and Logging"""
     start_time = time.time()
+    path = request.url.path
     
-    # 1. Network Security: Rate Limiting
-    client_ip = request.client.host if request.client else "unknown"
-    if not check_rate_limit(client_ip):
-        return JSONResponse(
-            status_code=429,
-            content={"detail": "Rate limit exceeded. Security policy enforcement."}
-        )
-    
-    # 2. Access Control: JWT Authentication
-    # Exclude health and root endpoints from auth
-    if request.url.path not in ["/", "/health", "/services/status", "/docs", "/openapi.json"]:
+    # Health and root endpoints skip rate limiting and auth
+    if path not in PUBLIC_PATHS:
+        # 1. Network Security: Rate Limiting
+        client_ip = request.client.host if request.client else "unknown"
+        if not check_rate_limit(client_ip):
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Rate limit exceeded. Security policy enforcement."}
+            )
+        
+        # 2. Access Control: JWT Authentication
         auth_header = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
             return JSONResponse(
@@ -67,8 +155,8 @@ async def security_and_logging_middleware(request: Request, call_next):
                 content={"detail": "Unauthorized: JWT Token required (Phase 3 Compliance)"}
             )
         
-        token = auth_header.split(" ")[1]
-        if not verify_token(token):
+        token = auth_header[7:]
+        if not verify_token_cached(token):
             return JSONResponse(
                 status_code=403,
                 content={"detail": "Forbidden: Invalid Security Token"}
@@ -80,7 +168,7 @@ async def security_and_logging_middleware(request: Request, call_next):
     response.headers["X-Process-Time"] = str(process_time)
     response.headers["X-Content-Type-Options"] = "nosniff" # Security header
     
-    logger.info(f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s")
+    logger.info(f"{request.method} {path} - {response.status_code} - {process_time:.3f}s")
     return response
 
 @app.get("/")
@@ -95,7 +183,8 @@ async def root():
             "tts": "/tts/* - Text to Speech synthesis",
             "documents": "/documents/* - Document processing and analysis",
             "chat": "/chat/* - AI Chat assistant",
-            "quiz": "/quiz/* - Quiz generation and assessment"
+            "quiz": "/quiz/* - Quiz generation and assessment",
+            "batch": "/batch - Several calls in one request"
         }
     }
 
@@ -108,36 +197,115 @@ async def health_check():
         "version": "2.0.0"
     }
 
+async def check_service(client: httpx.AsyncClient, url: str) -> dict:
+    """Query one backend's health endpoint"""
+    try:
+        response = await client.get(f"{url}/health", timeout=5.0)
+        if response.status_code == 200:
+            return {
+                "status": "healthy",
+                "url": url,
+                "response": response.json()
+            }
+        return {
+            "status": "unhealthy",
+            "url": url,
+            "error": f"HTTP {response.status_code}"
+        }
+    except Exception as e:
+        return {
+            "status": "unreachable",
+            "url": url,
+            "error": str(e)
+        }
+
 @app.get("/services/status")
-async def services_status():
+async def services_status(request: Request):
     """Check status of all backend services"""
-    status = {}
+    client = request.app.state.http
     
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        for name, url in SERVICES.items():
-            try:
-                response = await client.get(f"{url}/health")
-                if response.status_code == 200:
-                    status[name] = {
-                        "status": "healthy",
-                        "url": url,
-                        "response": response.json()
-                    }
-                else:
-                    status[name] = {
-                        "status": "unhealthy",
-                        "url": url,
-                        "error": f"HTTP {response.status_code}"
-                    }
-            except Exception as e:
-                status[name] = {
-                    "status": "unreachable",
-                    "url": url,
-                    "error": str(e)
-                }
+    # Query all backends concurrently: total latency is the slowest, not the sum
+    results = await asyncio.gather(*(check_service(client, url) for url in SERVICES.values()))
+    status = dict(zip(SERVICES.keys(), results))
     
     return {"services": status, "gateway": "operational"}
 
+class BatchItem(BaseModel):
+    method: str = "GET"
+    path: str
+    params: Optional[Dict[str, str]] = None
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    # Items run one after another in list order unless the caller says they are independent
+    parallel: bool = False
+
+async def run_batch_item(client: httpx.AsyncClient, item: BatchItem) -> dict:
+    """Dispatch one sub-request through the gateway app and capture its result"""
+    if not item.path.startswith("/") or item.path.startswith("/batch"):
+        return {"path": item.path, "status_code": 400, "body": {"detail": "Invalid batch path"}}
+    
+    try:
+        response = await client.request(
+            item.method.upper(),
+            item.path,
+            params=item.params,
+            json=item.body
+        )
+    except Exception as e:
+        logger.error(f"Batch sub-request {item.path} failed: {str(e)}")
+        return {"path": item.path, "status_code": 500, "body": {"detail": str(e)}}
+    
+    body = response.text
+    if response.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = response.json()
+        except ValueError:
+            # A malformed JSON body is returned as text rather than failing the whole batch
+            pass
+    return {"path": item.path, "status_code": response.status_code, "body": body}
+
+@app.post("/batch")
+async def batch(batch_request: BatchRequest, request: Request):
+    """Run several gateway calls (JSON bodies only) in a single round-trip, in order unless parallel is set"""
+    if len(batch_request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    
+    # Sub-requests re-enter this app in-process, carrying the caller's token and IP,
+    # so they go through the same auth and rate limiting as direct calls
+    headers = {}
+    if "authorization" in request.headers:
+        headers["Authorization"] = request.headers["authorization"]
+    client_ip = request.client.host if request.client else "unknown"
+    transport = httpx.ASGITransport(app=request.app, client=(client_ip, 0))
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway", headers=headers) as client:
+        if batch_request.parallel:
+            results = await asyncio.gather(*(run_batch_item(client, item) for item in batch_request.requests))
+        else:
+            results = [await run_batch_item(client, item) for item in batch_request.requests]
+    
+    return {"responses": results}
+
+def relay_response(response: httpx.Response) -> StreamingResponse:
+    """Forward a streamed backend response, closing it once the body is sent"""
+    # We filter out some headers that shouldn't be forwarded
+    # (content-encoding is kept since the raw, still-encoded body is relayed)
+    excluded_headers = ["content-length", "transfer-encoding", "connection"]
+    response_headers = {
+        k: v for k, v in response.headers.items() 
+        if k.lower() not in excluded_headers
+    }
+    
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=response_headers,
+        media_type=response.headers.get("content-type"),
+        background=BackgroundTask(response.aclose)
+    )
+
 async def proxy_request(service: str, path: str, request: Request, method: str = None):
     """Proxy request to backend service"""
     if service not in SERVICES:
@@ -150,57 +318,42 @@ async def proxy_request(service: str, path: str, request: Request, method: str =
     # Get request method
     http_method = method or request.method
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # Prepare headers
-            headers = dict(request.headers)
-            headers.pop("host", None)
-            headers.pop("content-length", None)
-            
-            # Get request body
-            body = await request.body()
-            
-            logger.info(f"Proxying {http_method} to {target_url}")
-            
-            # Make request to backend service
-            response = await client.request(
-                method=http_method,
-                url=target_url,
-                content=body,
-                headers=headers,
-                params=request.query_params
-            )
-            
-            # Forward the response from the microservice
-            # We filter out some headers that shouldn't be forwarded
-            excluded_headers = ["content-encoding", "content-length", "transfer-encoding", "connection"]
-            response_headers = {
-                k: v for k, v in response.headers.items() 
-                if k.lower() not in excluded_headers
-            }
+    client = request.app.state.http
+    try:
+        # Prepare headers
+        headers = dict(request.headers)
+        headers.pop("host", None)
+        headers.pop("content-length", None)
+        
+        logger.info(f"Proxying {http_method} to {target_url}")
+        
+        # Stream the request body to the backend service instead of buffering it
+        proxied = client.build_request(
+            method=http_method,
+            url=target_url,
+            content=request.stream(),
+            headers=headers,
+            params=request.query_params
+        )
+        response = await client.send(proxied, stream=True)
+        
+        return relay_response(response)
             
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=response_headers,
-                media_type=response.headers.get("content-type")
-            )
-                
-        except httpx.ConnectError:
-            logger.error(f"Connection failed to {target_url}")
-            raise HTTPException(
-                status_code=503, 
-                detail=f"Service '{service}' is temporarily unavailable. Please try again later."
-            )
-        except httpx.TimeoutException:
-            logger.error(f"Timeout connecting to {target_url}")
-            raise HTTPException(
-                status_code=504, 
-                detail=f"Service '{service}' request timed out."
-            )
-        except Exception as e:
-            logger.error(f"Gateway error: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+    except httpx.ConnectError:
+        logger.error(f"Connection failed to {target_url}")
+        raise HTTPException(
+            status_code=503, 
+            detail=f"Service '{service}' is temporarily unavailable. Please try again later."
+        )
+    except httpx.TimeoutException:
+        logger.error(f"Timeout connecting to {target_url}")
+        raise HTTPException(
+            status_code=504, 
+            detail=f"Service '{service}' request timed out."
+        )
+    except Exception as e:
+        logger.error(f"Gateway error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 # Generic API routes
 @app.api_route("/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
@@ -210,48 +363,56 @@ async def proxy(service: str, path: str, request: Request):
 
 # Special handling for file uploads (STT and Documents)
 @app.post("/stt/transcribe")
-async def stt_transcribe(file: UploadFile = File(...), language: str = "ar"):
+async def stt_transcribe(request: Request, file: UploadFile = File(...), language: str = "ar"):
     """Upload audio file for transcription"""
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            # Read file content
-            content = await file.read()
-            
-            # Create multipart form data
-            files = {"file": (file.filename, content, file.content_type)}
-            params = {"language": language}
-            
-            response = await client.post(
-                f"{SERVICES['stt']}/api/stt/transcribe",
-                files=files,
-                params=params
-            )
-            
-            return response.json()
-        except httpx.ConnectError:
-            raise HTTPException(status_code=503, detail="STT Service is unavailable")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    client = request.app.state.http_upload
+    try:
+        # Create multipart form data, streamed from the spooled upload file
+        files = {"file": (file.filename, file.file, file.content_type)}
+        params = {"language": language}
+        
+        upload = client.build_request(
+            "POST",
+            f"{SERVICES['stt']}/api/stt/transcribe",
+            files=files,
+            params=params
+        )
+        response = await client.send(upload, stream=True)
+        
+        return relay_response(response)
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail="STT Service is unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/documents/upload")
-async def documents_upload(file: UploadFile = File(...)):
+async def documents_upload(request: Request, file: UploadFile = File(...)):
     """Upload document for processing"""
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            content = await file.read()
-            files = {"file": (file.filename, content, file.content_type)}
-            
-            response = await client.post(
-                f"{SERVICES['documents']}/api/documents/upload",
-                files=files
-            )
-            
-            return response.json()
-        except httpx.ConnectError:
-            raise HTTPException(status_code=503, detail="Document Service is unavailable")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    client = request.app.state.http_upload
+    try:
+        files = {"file": (file.filename, file.file, file.content_type)}
+        
+        upload = client.build_request(
+            "POST",
+            f"{SERVICES['documents']}/api/documents/upload",
+            files=files
+        )
+        response = await client.send(upload, stream=True)
+        
+        return relay_response(response)
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail="Document Service is unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string; each worker builds its own client pool
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("GATEWAY_WORKERS", os.cpu_count() or 1))
+    )
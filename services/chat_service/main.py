@@ -1,10 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+import asyncio
 import os
+import re
 import uuid
+import orjson
 import random
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from collections import OrderedDict
 from datetime import datetime
+from itertools import islice
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
@@ -14,14 +19,18 @@ app = FastAPI(title="Chat Completion Service")
 # Configuration
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 S3_BUCKET = os.getenv("CHAT_S3_BUCKET", "chat-service-storage-dev")
+MAX_CONVERSATIONS = int(os.getenv("CHAT_MAX_CONVERSATIONS", "10000"))
 
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(S3_BUCKET)
 
-# In-memory storage
-conversations: Dict[str, List[dict]] = {}
+# In-memory storage: LRU of recently active conversations, older ones live in the S3 archive
+conversations: "OrderedDict[str, List[dict]]" = OrderedDict()
 document_context: Dict[str, str] = {}  # Store document text for context
 
+# Keep references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -51,47 +60,145 @@ KNOWLEDGE_BASE = {
 GREETING_KEYWORDS = ["hello", "hi", "hey", "welcome"]
 HELP_KEYWORDS = ["help", "how", "explain", "guide"]
 
+# Fixed replies, built once at import
+GREETING_RESPONSE = "Welcome! I'm your AI learning assistant. How can I help you today? 🤖"
+HELP_RESPONSE = """🌟 **I can help you with:**
+- **STT**: Convert your voice notes to text.
+- **TTS**: Generate natural speech from text.
+- **Documents**: Analyze and summarize your PDFs.
+- **Quizzes**: Generate tests from your study materials.
+- Ask me anything about Cloud, Python, or your documents!"""
+
+# Every keyword maps to its intent; knowledge base entries keep their dict order as priority
+_KNOWLEDGE_KEYS = list(KNOWLEDGE_BASE)
+_KEYWORD_INTENTS: Dict[str, Tuple[str, int]] = {}
+for _kw in GREETING_KEYWORDS:
+    _KEYWORD_INTENTS.setdefault(_kw, ("greeting", 0))
+for _kw in HELP_KEYWORDS:
+    _KEYWORD_INTENTS.setdefault(_kw, ("help", 0))
+for _rank, _kw in enumerate(_KNOWLEDGE_KEYS):
+    _KEYWORD_INTENTS.setdefault(_kw, ("knowledge", _rank))
+
+# One compiled pattern for all keywords; the lookahead reports overlapping hits too
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_INTENTS, key=len, reverse=True)) + "))"
+)
+
+def classify_message(message_lower: str) -> Tuple[Optional[str], Optional[str]]:
+    """Scan the message once, returning (intent, knowledge base key)"""
+    intent = None
+    knowledge_rank = None
+    for match in _KEYWORD_RE.finditer(message_lower):
+        kind, rank = _KEYWORD_INTENTS[match.group(1)]
+        if kind == "greeting":
+            intent = "greeting"
+        elif kind == "help":
+            if intent is None:
+                intent = "help"
+        elif knowledge_rank is None or rank < knowledge_rank:
+            knowledge_rank = rank
+    knowledge_key = _KNOWLEDGE_KEYS[knowledge_rank] if knowledge_rank is not None else None
+    return intent, knowledge_key
+
 def find_knowledge(query: str) -> Optional[str]:
     """Find relevant knowledge entry"""
-    query_lower = query.lower()
-    for key, value in KNOWLEDGE_BASE.items():
-        if key in query_lower:
-            return value
-    return None
+    _, key = classify_message(query.lower())
+    return KNOWLEDGE_BASE[key] if key else None
 
 def generate_ai_response(message: str, conversation_history: List[dict], document_text: str = None) -> str:
     """Generate intelligent AI response"""
-    message_lower = message.lower()
+    intent, knowledge_key = classify_message(message.lower())
     
-    if any(kw in message_lower for kw in GREETING_KEYWORDS):
-        return "Welcome! I'm your AI learning assistant. How can I help you today? 🤖"
+    if intent == "greeting":
+        return GREETING_RESPONSE
     
-    if any(kw in message_lower for kw in HELP_KEYWORDS):
-        return """🌟 **I can help you with:**
-- **STT**: Convert your voice notes to text.
-- **TTS**: Generate natural speech from text.
-- **Documents**: Analyze and summarize your PDFs.
-- **Quizzes**: Generate tests from your study materials.
-- Ask me anything about Cloud, Python, or your documents!"""
+    if intent == "help":
+        return HELP_RESPONSE
 
     if document_text:
         return f"📚 **Based on the uploaded document:**\n\n{document_text[:300]}...\n\nWould you like me to generate a quiz based on this content?"
 
-    knowledge = find_knowledge(message)
-    if knowledge:
-        return f"📖 **{message.capitalize()}:**\n\n{knowledge}\n\nDo you want to know more?"
+    if knowledge_key:
+        title = message[:1].upper() + message[1:]
+        return f"📖 **{title}:**\n\n{KNOWLEDGE_BASE[knowledge_key]}\n\nDo you want to know more?"
 
     # Default responses
     return f"Great question about '{message}'! Try uploading a document about this topic so I can assist you better. 📄"
 
+def _conversation_key(conv_id: str) -> str:
+    return f"conversations/{conv_id}/history.json"
+
+def archive_conversation(conv_id: str, body: bytes):
+    """Upload a serialized conversation snapshot to S3 (blocking, run in a thread)"""
+    try:
+        s3_handler.s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=_conversation_key(conv_id),
+            Body=body,
+            ContentType="application/json"
+        )
+    except Exception as e:
+        print(f"S3 archive failed: {e}")
+
+def fetch_archived_conversation(conv_id: str) -> Optional[List[dict]]:
+    """Download a conversation from the S3 archive (blocking, run in a thread)"""
+    # Only a missing key means "not archived"; other errors propagate so a conversation that
+    # failed to load is never restarted empty and later archived over the real history
+    try:
+        obj = s3_handler.s3_client.get_object(Bucket=S3_BUCKET, Key=_conversation_key(conv_id))
+    except s3_handler.s3_client.exceptions.NoSuchKey:
+        return None
+    return orjson.loads(obj["Body"].read())
+
+def delete_archived_conversation(conv_id: str):
+    """Remove a conversation from the S3 archive (blocking, run in a thread)"""
+    try:
+        s3_handler.s3_client.delete_object(Bucket=S3_BUCKET, Key=_conversation_key(conv_id))
+    except Exception as e:
+        print(f"S3 archive delete failed: {e}")
+
+def run_in_background(func, *args):
+    """Run a blocking call in a worker thread without awaiting it"""
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def cache_conversation(conv_id: str, messages: List[dict]):
+    """Store a conversation as most recently used, evicting the oldest ones to S3"""
+    conversations[conv_id] = messages
+    conversations.move_to_end(conv_id)
+    while len(conversations) > MAX_CONVERSATIONS:
+        old_id, old_messages = conversations.popitem(last=False)
+        run_in_background(archive_conversation, old_id, orjson.dumps(old_messages))
+
+async def load_conversation(conv_id: str) -> Optional[List[dict]]:
+    """Get a conversation from the hot cache, falling back to the S3 archive"""
+    messages = conversations.get(conv_id)
+    if messages is None:
+        try:
+            archived = await asyncio.to_thread(fetch_archived_conversation, conv_id)
+        except Exception as e:
+            print(f"S3 archive lookup failed: {e}")
+            raise HTTPException(status_code=503, detail="Conversation archive unavailable")
+        # Another request may have loaded it while we were waiting on S3
+        messages = conversations.get(conv_id)
+        if messages is None:
+            if archived is None:
+                return None
+            messages = archived
+    cache_conversation(conv_id, messages)
+    return messages
+
 @app.post("/api/chat/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest):
+async def send_message(request: ChatRequest, background: BackgroundTasks):
     """Send a message and get AI response"""
     conv_id = request.conversation_id or str(uuid.uuid4())
     
     # Initialize or get conversation
-    if conv_id not in conversations:
-        conversations[conv_id] = []
+    messages = await load_conversation(conv_id) if request.conversation_id else None
+    if messages is None:
+        messages = []
+        cache_conversation(conv_id, messages)
     
     # Add user message
     user_msg = {
@@ -99,7 +206,7 @@ async def send_message(request: ChatRequest):
         "content": request.message,
         "timestamp": datetime.utcnow().isoformat()
     }
-    conversations[conv_id].append(user_msg)
+    messages.append(user_msg)
     
     # Get document context if provided
     doc_text = None
@@ -109,7 +216,7 @@ async def send_message(request: ChatRequest):
     # Generate response
     ai_response = generate_ai_response(
         request.message, 
-        conversations[conv_id],
+        messages,
         doc_text
     )
     
@@ -119,46 +226,31 @@ async def send_message(request: ChatRequest):
         "content": ai_response,
         "timestamp": datetime.utcnow().isoformat()
     }
-    conversations[conv_id].append(assistant_msg)
+    messages.append(assistant_msg)
     
-    # Log to Kafka
-    try:
-        kafka_handler.send_message("chat.message", {
-            "conversation_id": conv_id,
-            "user_message": request.message[:100],
-            "assistant_response": ai_response[:100],
-            "document_id": request.document_id,
-            "timestamp": assistant_msg["timestamp"]
-        })
-    except Exception as e:
-        print(f"Kafka logging failed: {e}")
-    
-    # Archive conversation to S3 if it gets long
-    if len(conversations[conv_id]) > 10 and len(conversations[conv_id]) % 10 == 0:
-        try:
-            import json
-            s3_key = f"conversations/{conv_id}/history.json"
-            s3_handler.s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=json.dumps(conversations[conv_id], ensure_ascii=False).encode('utf-8'),
-                ContentType="application/json"
-            )
-        except Exception as e:
-            print(f"S3 archive failed: {e}")
+    # Log to Kafka and archive long conversations once the response has been sent
+    background.add_task(kafka_handler.send_message, "chat.message", {
+        "conversation_id": conv_id,
+        "user_message": request.message[:100],
+        "assistant_response": ai_response[:100],
+        "document_id": request.document_id,
+        "timestamp": assistant_msg["timestamp"]
+    })
+    if len(messages) > 10 and len(messages) % 10 == 0:
+        background.add_task(archive_conversation, conv_id, orjson.dumps(messages))
     
     return ChatResponse(
         conversation_id=conv_id,
         response=ai_response,
-        message_count=len(conversations[conv_id]),
+        message_count=len(messages),
         created_at=assistant_msg["timestamp"]
     )
 
 @app.get("/api/chat/conversations")
-async def list_conversations(limit: int = 10):
+async def list_conversations(limit: int = Query(10, ge=0)):
     """List all conversations"""
     items = []
-    for conv_id, messages in list(conversations.items())[:limit]:
+    for conv_id, messages in islice(conversations.items(), limit):
         last_msg = messages[-1] if messages else None
         items.append({
             "id": conv_id,
@@ -171,19 +263,21 @@ async def list_conversations(limit: int = 10):
 @app.get("/api/chat/conversations/{id}")
 async def get_conversation(id: str):
     """Get conversation history"""
-    if id in conversations:
+    messages = await load_conversation(id)
+    if messages is not None:
         return {
             "id": id,
-            "messages": conversations[id],
-            "message_count": len(conversations[id])
+            "messages": messages,
+            "message_count": len(messages)
         }
     raise HTTPException(status_code=404, detail="Conversation not found")
 
 @app.delete("/api/chat/conversations/{id}")
 async def delete_conversation(id: str):
     """Delete a conversation"""
-    if id in conversations:
+    if await load_conversation(id) is not None:
         conversations.pop(id)
+        run_in_background(delete_archived_conversation, id)
         return {"message": "Conversation deleted", "id": id}
     raise HTTPException(status_code=404, detail="Conversation not found")
 
@@ -193,10 +287,16 @@ async def add_document_context(document_id: str, text: str):
     document_context[document_id] = text
     return {"message": "Document context added", "document_id": document_id}
 
+@app.on_event("shutdown")
+def flush_kafka():
+    """Deliver buffered Kafka messages before the process exits"""
+    kafka_handler.flush()
+
 @app.get("/health")
 async def health():
     return {"status": "healthy", "service": "chat", "version": "2.0"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8004)
+    # Single worker: conversations are held in this process's memory
+    uvicorn.run(app, host="0.0.0.0", port=8004, loop="uvloop", http="httptools")
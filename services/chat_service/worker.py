@@ -16,24 +16,35 @@ s3_handler = S3Handler(CHAT_S3_BUCKET)
 # Optional: Initialize LLM
 # llm = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"))
 
+def process_chat_event(data):
+    conv_id = data.get("conversation_id")
+    user_msg = data.get("message")
+    doc_id = data.get("document_id")
+    
+    # Here we would use LangChain to generate a response based on doc context
+    # and previous history stored in S3/Postgres
+    
+    # Log to S3 (Simulated)
+    log_key = f"history/{conv_id}.json"
+    # Normally we'd append to existing history
+    
+    print(f"Processing chat for {conv_id}: {user_msg}")
+
+def process_batch(messages):
+    for message in messages:
+        process_chat_event(message.value)
+
 def process_chat_events():
-    consumer = kafka_handler.get_consumer("chat.message", "chat_worker_group")
+    consumer = kafka_handler.get_consumer("chat.message", "chat_worker_group", enable_auto_commit=False)
     
-    for message in consumer:
-        data = message.value
-        conv_id = data.get("conversation_id")
-        user_msg = data.get("message")
-        doc_id = data.get("document_id")
-        
-        # Here we would use LangChain to generate a response based on doc context
-        # and previous history stored in S3/Postgres
-        
-        # Log to S3 (Simulated)
-        log_key = f"history/{conv_id}.json"
-        # Normally we'd append to existing history
-        
-        print(f"Processing chat for {conv_id}: {user_msg}")
+    # Pull records in batches and commit once per batch instead of per record
+    while True:
+        records = consumer.poll(timeout_ms=200, max_records=500)
+        if not records:
+            continue
+        for tp, messages in records.items():
+            process_batch(messages)
+        consumer.commit()
 
 if __name__ == "__main__":
     process_chat_events()
-Line 1: # chat_service/worker.py
@@ -1,4 +1,7 @@
-import json
+import msgpack
+import random
+import threading
+import time
 from kafka import KafkaProducer, KafkaConsumer
 import logging
 
@@ -6,50 +9,78 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class KafkaHandler:
-    def __init__(self, bootstrap_servers):
+    def __init__(self, bootstrap_servers, **producer_config):
         self.bootstrap_servers = bootstrap_servers
+        # Let the background sender batch messages instead of one request each;
+        # services with bursty event streams can override these per handler
+        self.producer_config = {
+            "linger_ms": 10,
+            "batch_size": 64 * 1024,
+            "compression_type": "lz4",
+            "acks": 1,
+            **producer_config
+        }
         self.producer = None
+        self._lock = threading.Lock()
 
     def get_producer(self):
-        if not self.producer:
-            import time
-            retries = 5
-            while retries > 0:
-                try:
-                    self.producer = KafkaProducer(
-                        bootstrap_servers=self.bootstrap_servers,
-                        value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                        request_timeout_ms=5000
-                    )
-                    logger.info("Successfully connected to Kafka")
-                    break
-                except Exception as e:
-                    logger.warning(f"Failed to connect to Kafka, retrying... ({retries} left). Error: {e}")
-                    retries -= 1
-                    time.sleep(5)
+        if self.producer:
+            return self.producer
+        # Only one caller builds the producer; the rest wait and reuse it
+        with self._lock:
             if not self.producer:
-                logger.error("Could not connect to Kafka after multiple retries")
-                # Don't raise here, allow the app to start but fail on actual usage
+                self._connect()
         return self.producer
 
+    def _connect(self):
+        retries = 5
+        for attempt in range(retries):
+            try:
+                self.producer = KafkaProducer(
+                    bootstrap_servers=self.bootstrap_servers,
+                    value_serializer=msgpack.packb,
+                    request_timeout_ms=5000,
+                    **self.producer_config
+                )
+                logger.info("Successfully connected to Kafka")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to connect to Kafka, retrying... ({retries - attempt - 1} left). Error: {e}")
+                if attempt < retries - 1:
+                    # Exponential backoff with jitter so workers don't retry in lockstep
+                    time.sleep(min(30, 2 ** attempt + random.random()))
+        logger.error("Could not connect to Kafka after multiple retries")
+        # Don't raise here, allow the app to start but fail on actual usage
+
     def send_message(self, topic, message):
         try:
             producer = self.get_producer()
             if producer:
-                producer.send(topic, message)
-                producer.flush()
-                logger.info(f"Message sent to topic {topic}")
+                future = producer.send(topic, message)
+                future.add_errback(self._on_send_error, topic)
+                logger.info(f"Message queued for topic {topic}")
             else:
                 logger.error(f"Cannot send message to {topic}: No producer available")
         except Exception as e:
             logger.error(f"Error sending message to Kafka: {e}")
 
-    def get_consumer(self, topic, group_id):
+    def _on_send_error(self, exc, topic):
+        logger.error(f"Error delivering message to {topic}: {exc}")
+
+    def flush(self):
+        """Block until all buffered messages are delivered (call on shutdown)"""
+        if self.producer:
+            try:
+                self.producer.flush()
+            except Exception as e:
+                logger.error(f"Error flushing Kafka producer: {e}")
+
+    def get_consumer(self, topic, group_id, enable_auto_commit=True):
         return KafkaConsumer(
             topic,
             bootstrap_servers=self.bootstrap_servers,
             auto_offset_reset='earliest',
-            enable_auto_commit=True,
+            enable_auto_commit=enable_auto_commit,
             group_id=group_id,
-            value_deserializer=lambda x: json.loads(x.decode('utf-8'))
+            value_deserializer=msgpack.unpackb
         )
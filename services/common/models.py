@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -105,6 +105,12 @@ class ChatHistory(Base):
     document_id = Column(String(100), nullable=True)  # If chat is about a document
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+# Conversation history is always read in timestamp order
+Index('ix_chat_conv_ts', ChatHistory.conversation_id, ChatHistory.timestamp)
+
+# Workers poll for documents that still need processing
+Index('ix_doc_pending', Document.status, postgresql_where=(Document.status != 'completed'))
+
 class Transcription(Base):
     """Speech-to-text transcription records"""
     __tablename__ = 'transcriptions'
@@ -1,6 +1,6 @@
 import boto3
 import os
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,16 +22,54 @@ class S3Handler:
             self.s3_client.upload_file(file_path, self.bucket_name, object_name)
             logger.info(f"File {file_path} uploaded to {self.bucket_name}/{object_name}")
             return True
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
+            logger.error(e)
+            return False
+
+    def upload_bytes(self, object_name, data):
+        try:
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=object_name, Body=data)
+            logger.info(f"{len(data)} bytes uploaded to {self.bucket_name}/{object_name}")
+            return True
+        except (ClientError, BotoCoreError) as e:
+            logger.error(e)
+            return False
+
+    def upload_fileobj(self, fileobj, object_name):
+        try:
+            self.s3_client.upload_fileobj(fileobj, self.bucket_name, object_name)
+            logger.info(f"Stream uploaded to {self.bucket_name}/{object_name}")
+            return True
+        except (ClientError, BotoCoreError) as e:
+            logger.error(e)
+            return False
+
+    def object_exists(self, object_name):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+            return True
+        except BotoCoreError as e:
             logger.error(e)
             return False
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                logger.error(e)
+            return False
+
+    def download_bytes(self, object_name):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=object_name)
+            return response["Body"].read()
+        except (ClientError, BotoCoreError) as e:
+            logger.error(e)
+            return None
 
     def download_file(self, object_name, file_path):
         try:
             self.s3_client.download_file(self.bucket_name, object_name, file_path)
             logger.info(f"File {object_name} downloaded from {self.bucket_name} to {file_path}")
             return True
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(e)
             return False
 
@@ -42,6 +80,6 @@ class S3Handler:
                                                                     'Key': object_name},
                                                             ExpiresIn=expiration)
             return response
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(e)
             return None
@@ -0,0 +1,108 @@
+import os
+import time
+from itertools import islice
+from typing import Any, List, Optional, Tuple
+
+import orjson
+from cachetools import TTLCache
+
+REDIS_URL = os.getenv("REDIS_URL")
+STORE_TTL_SECONDS = int(os.getenv("STORE_TTL_SECONDS", "86400"))
+# Entry cap per store for the in-process fallback, so memory stays bounded without Redis
+STORE_MEMORY_MAXSIZE = int(os.getenv("STORE_MEMORY_MAXSIZE", "1000"))
+
+class Store:
+    """Namespaced record store: Redis when REDIS_URL is set, otherwise a process-local TTL cache.
+
+    Values must be JSON-serializable; records expire after `ttl` seconds. In Redis, keys
+    written with set() are also indexed in a sorted set scored by expiry time, so listing and
+    counting never walk the keyspace.
+    """
+
+    def __init__(self, namespace: str, ttl: int = STORE_TTL_SECONDS, maxsize: int = STORE_MEMORY_MAXSIZE):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.redis = None
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._index = f"{namespace}.index"
+        if REDIS_URL:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(REDIS_URL)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        if self.redis is None:
+            return self._memory.get(key)
+        raw = await self.redis.get(self._key(key))
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any):
+        if self.redis is None:
+            self._memory[key] = value
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.setex(self._key(key), self.ttl, orjson.dumps(value))
+            pipe.zadd(self._index, {key: time.time() + self.ttl})
+            await pipe.execute()
+
+    async def delete(self, key: str) -> bool:
+        if self.redis is None:
+            return self._memory.pop(key, None) is not None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self._key(key))
+            pipe.zrem(self._index, key)
+            deleted, _ = await pipe.execute()
+        return deleted > 0
+
+    async def _prune_index(self):
+        await self.redis.zremrangebyscore(self._index, "-inf", time.time())
+
+    async def exists(self, key: str) -> bool:
+        if self.redis is None:
+            return key in self._memory
+        return await self.redis.exists(self._key(key)) > 0
+
+    async def append(self, key: str, value: Any):
+        """Append to the list stored at key"""
+        if self.redis is None:
+            # Re-assign so the entry's TTL is refreshed, like EXPIRE on the Redis list
+            values = self._memory.get(key, [])
+            values.append(value)
+            self._memory[key] = values
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(self._key(key), orjson.dumps(value))
+            pipe.expire(self._key(key), self.ttl)
+            await pipe.execute()
+
+    async def get_list(self, key: str) -> List[Any]:
+        if self.redis is None:
+            return list(self._memory.get(key, []))
+        return [orjson.loads(raw) for raw in await self.redis.lrange(self._key(key), 0, -1)]
+
+    async def items(self, limit: int) -> List[Tuple[str, Any]]:
+        """Return up to `limit` (key, value) pairs"""
+        if limit <= 0:
+            return []
+        if self.redis is None:
+            self._memory.expire()
+            return list(islice(self._memory.items(), limit))
+        await self._prune_index()
+        keys = [key.decode() for key in await self.redis.zrange(self._index, 0, limit - 1)]
+        if not keys:
+            return []
+        values = await self.redis.mget([self._key(key) for key in keys])
+        return [(key, orjson.loads(raw)) for key, raw in zip(keys, values) if raw is not None]
+
+    async def count(self) -> int:
+        if self.redis is None:
+            self._memory.expire()
+            return len(self._memory)
+        await self._prune_index()
+        return await self.redis.zcard(self._index)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
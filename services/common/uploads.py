@@ -0,0 +1,18 @@
+import hashlib
+import tempfile
+
+from fastapi import UploadFile
+
+# Uploads are copied to disk in chunks of this size so memory stays bounded
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+async def save_upload_to_temp(file: UploadFile, suffix: str) -> tuple:
+    """Stream an upload into a NamedTemporaryFile; returns (path, size, sha256 hex). Caller deletes the file."""
+    size = 0
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            temp.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    return temp.name, size, digest.hexdigest()
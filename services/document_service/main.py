@@ -1,16 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+import io
 import os
+import re
 import uuid
+import asyncio
 import tempfile
 import httpx
+from concurrent.futures import ProcessPoolExecutor
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
+from services.common.uploads import save_upload_to_temp
+from services.common.store import Store
 
-app = FastAPI(title="Document Reader Service")
+app = FastAPI(title="Document Reader Service", default_response_class=ORJSONResponse)
 
 # Configuration
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
@@ -20,7 +27,15 @@ kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(S3_BUCKET)
 
 # Global document storage (shared across services)
-documents = {}
+documents = Store("doc")
+document_texts = Store("doc_text")
+# Extraction results keyed by sha256 of the uploaded bytes, so re-uploads skip parsing
+EXTRACTION_CACHE_TTL = int(os.getenv("DOC_EXTRACTION_CACHE_TTL", str(7 * 86400)))
+extraction_cache = Store("doc_extract", ttl=EXTRACTION_CACHE_TTL)
+
+# PDF/DOCX parsing holds the GIL, so it runs in worker processes off the event loop
+DOC_EXTRACT_WORKERS = int(os.getenv("DOC_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+extract_pool = ProcessPoolExecutor(max_workers=DOC_EXTRACT_WORKERS)
 
 class DocumentResponse(BaseModel):
     id: str
@@ -31,36 +46,96 @@ class DocumentResponse(BaseModel):
     page_count: Optional[int] = None
     word_count: Optional[int] = None
 
+# Extracted text is buffered in memory up to SPOOL_MAX_BYTES, then spilled to a temp file;
+# only this many leading chars are kept as a preview
+PREVIEW_CHARS = 2000
+# Texts that outgrow the in-memory buffer are stored in S3 rather than inline in the store
+SPOOL_MAX_BYTES = 1_000_000
+
+_WORD_RE = re.compile(rb"\S+")
+
+def count_words(data: bytes) -> int:
+    """Count whitespace-separated words in UTF-8 text without building a list"""
+    return sum(1 for _ in _WORD_RE.finditer(data))
+
+class TextBuffer:
+    """Accumulates extracted text, tracking counts and a preview.
+
+    Large texts spill to a named temp file so the result can cross a process boundary by path.
+    """
+    
+    def __init__(self):
+        self.file = io.BytesIO()
+        self.path = None
+        self.preview = ""
+        self.length = 0
+        self.size = 0
+        self.word_count = 0
+    
+    def _write(self, text: str):
+        data = text.encode('utf-8')
+        if self.path is None and self.size + len(data) > SPOOL_MAX_BYTES:
+            self._spill()
+        self.file.write(data)
+        if len(self.preview) < PREVIEW_CHARS:
+            self.preview += text[:PREVIEW_CHARS - len(self.preview)]
+        self.length += len(text)
+        self.size += len(data)
+        return data
+    
+    def _spill(self):
+        spill = tempfile.NamedTemporaryFile(delete=False, suffix='.txt')
+        spill.write(self.file.getvalue())
+        self.file = spill
+        self.path = spill.name
+    
+    def add_part(self, text: str):
+        """Append a page/paragraph, separated from the previous one by a blank line"""
+        if self.length:
+            self._write("\n\n")
+        self.word_count += count_words(self._write(text))
+    
+    def result(self, page_count: int, status: str) -> dict:
+        if self.path is None:
+            text_data = self.file.getvalue()
+        else:
+            text_data = None
+            self.file.close()
+        return {
+            "text_data": text_data,
+            "text_path": self.path,
+            "preview": self.preview,
+            "length": self.length,
+            "size": self.size,
+            "page_count": page_count,
+            "word_count": self.word_count,
+            "status": status
+        }
+
+def extraction_error(message: str) -> dict:
+    buffer = TextBuffer()
+    buffer.add_part(message)
+    result = buffer.result(0, "error")
+    result["word_count"] = 0
+    return result
+
 def extract_pdf_text(file_path: str) -> dict:
     """Extract text from PDF"""
     try:
-        import PyPDF2
+        import fitz  # PyMuPDF
         
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            pages = len(reader.pages)
-            text_parts = []
+        buffer = TextBuffer()
+        with fitz.open(file_path) as doc:
+            pages = doc.page_count
             
-            for page in reader.pages:
-                text = page.extract_text()
+            for page in doc:
+                text = page.get_text("text")
                 if text:
-                    text_parts.append(text.strip())
-            
-            full_text = "\n\n".join(text_parts)
-            
-            return {
-                "text": full_text,
-                "page_count": pages,
-                "word_count": len(full_text.split()),
-                "status": "completed"
-            }
+                    buffer.add_part(text.strip())
+        
+        return buffer.result(pages, "completed")
     except Exception as e:
-        return {
-            "text": f"Error extracting text: {str(e)}",
-            "page_count": 0,
-            "word_count": 0,
-            "status": "error"
-        }
+        return extraction_error(f"Error extracting text: {str(e)}")
 
 def extract_docx_text(file_path: str) -> dict:
     """Extract text from DOCX"""
@@ -68,97 +143,126 @@ def extract_docx_text(file_path: str) -> dict:
         from docx import Document
         
         doc = Document(file_path)
-        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-        full_text = "\n\n".join(paragraphs)
+        buffer = TextBuffer()
+        for p in doc.paragraphs:
+            # p.text rebuilds the string from XML on every access, so read it once
+            text = p.text
+            if text and not text.isspace():
+                buffer.add_part(text)
         
-        return {
-            "text": full_text,
-            "page_count": 1,
-            "word_count": len(full_text.split()),
-            "status": "completed"
-        }
+        return buffer.result(1, "completed")
     except Exception as e:
-        return {
-            "text": f"Error: {str(e)}",
-            "page_count": 0,
-            "word_count": 0,
-            "status": "error"
-        }
+        return extraction_error(f"Error: {str(e)}")
 
-def extract_txt_text(content: bytes) -> dict:
+def extract_txt_text(file_path: str) -> dict:
     """Extract text from TXT"""
     try:
-        text = content.decode('utf-8', errors='ignore')
-        return {
-            "text": text,
-            "page_count": 1,
-            "word_count": len(text.split()),
-            "status": "completed"
-        }
+        with open(file_path, encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+        buffer = TextBuffer()
+        buffer.add_part(text)
+        return buffer.result(1, "completed")
     except Exception as e:
-        return {
-            "text": str(e),
-            "page_count": 0,
-            "word_count": 0,
-            "status": "error"
-        }
+        return extraction_error(str(e))
+
+async def store_extracted_text(digest: str, file_ext: str, result: dict) -> dict:
+    """Return a text reference: the text inline, or an S3 key when it is large"""
+    text_path = result["text_path"]
+    if text_path is None:
+        return {"text": result["text_data"].decode('utf-8')}
+    try:
+        s3_key = f"documents/{digest}/{file_ext}/text.txt"
+        loop = asyncio.get_running_loop()
+        with open(text_path, 'rb') as text_file:
+            uploaded = await loop.run_in_executor(None, s3_handler.upload_fileobj, text_file, s3_key)
+        if uploaded:
+            return {"s3_key": s3_key}
+        # boto3 closes the file object when an upload fails, so read the spill file again
+        with open(text_path, 'rb') as text_file:
+            return {"text": text_file.read().decode('utf-8')}
+    finally:
+        os.unlink(text_path)
+
+async def load_document_text(doc_id: str) -> str:
+    """Read a document's full text back from the store or S3"""
+    stored = await document_texts.get(doc_id) or {}
+    if "s3_key" in stored:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, s3_handler.download_bytes, stored["s3_key"])
+        return data.decode('utf-8') if data else ""
+    return stored.get("text", "")
 
 @app.post("/api/documents/upload", response_model=DocumentResponse)
 async def upload_document(file: UploadFile = File(...)):
     """Upload and process document"""
     doc_id = str(uuid.uuid4())
-    content = await file.read()
     file_ext = file.filename.split('.')[-1].lower() if '.' in file.filename else 'txt'
+    temp_path, file_size, digest = await save_upload_to_temp(file, f'.{file_ext}')
     
-    temp_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as temp:
-            temp.write(content)
-            temp_path = temp.name
-        
-        # Extract based on type
-        if file_ext == 'pdf':
-            result = extract_pdf_text(temp_path)
-        elif file_ext in ['doc', 'docx']:
-            result = extract_docx_text(temp_path)
-        elif file_ext == 'txt':
-            result = extract_txt_text(content)
-        else:
-            result = extract_txt_text(content)
+        # The extractor depends on the extension, so the same bytes under another type are a different entry
+        cache_key = f"{digest}:{file_ext}"
+        result = await extraction_cache.get(cache_key)
+        if not result:
+            # Extract based on type
+            if file_ext == 'pdf':
+                extractor = extract_pdf_text
+            elif file_ext in ['doc', 'docx']:
+                extractor = extract_docx_text
+            elif file_ext == 'txt':
+                extractor = extract_txt_text
+            else:
+                extractor = extract_txt_text
+            
+            loop = asyncio.get_running_loop()
+            extracted = await loop.run_in_executor(extract_pool, extractor, temp_path)
+            
+            result = {
+                "text_ref": await store_extracted_text(digest, file_ext, extracted),
+                "preview": extracted["preview"],
+                "length": extracted["length"],
+                "page_count": extracted["page_count"],
+                "word_count": extracted["word_count"],
+                "status": extracted["status"]
+            }
+            if result["status"] == "completed":
+                await extraction_cache.set(cache_key, result)
         
-        # Create summary
-        text = result["text"]
-        if len(text) > 500:
-            summary = text[:500] + "..."
+        # Create summary from the in-memory preview
+        preview = result["preview"]
+        if result["length"] > 500:
+            summary = preview[:500] + "..."
         else:
-            summary = text
+            summary = preview
         
-        # Store document GLOBALLY
+        # Store document metadata; full text is kept separately
+        await document_texts.set(doc_id, result["text_ref"])
         doc_data = {
             "id": doc_id,
             "filename": file.filename,
             "file_type": file_ext,
-            "file_size": len(content),
-            "text": text,
+            "file_size": file_size,
             "summary": summary,
             "page_count": result["page_count"],
             "word_count": result["word_count"],
             "status": result["status"],
             "created_at": datetime.utcnow().isoformat()
         }
-        documents[doc_id] = doc_data
+        await documents.set(doc_id, doc_data)
         
         # Send to Kafka for Quiz service
         try:
             kafka_handler.send_message("document.processed", {
                 "id": doc_id,
                 "filename": file.filename,
-                "text": text[:2000],  # Send text preview for quiz
+                "text": preview,  # Send text preview for quiz
+                "text_s3_key": result["text_ref"].get("s3_key"),  # Full text, when it was too large to keep inline
                 "word_count": result["word_count"]
             })
         except Exception as e:
             print(f"Kafka error: {e}")
         
+        # The full text is served by /api/documents/{id}/text rather than echoed here
         return DocumentResponse(
             id=doc_id,
             filename=file.filename,
@@ -173,24 +277,21 @@ async def upload_document(file: UploadFile = File(...)):
 {summary}
 
 ✅ You can now generate a quiz from this document!""",
-            text=text,
             page_count=result["page_count"],
             word_count=result["word_count"]
         )
-        
     finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
+        os.unlink(temp_path)
 
 @app.get("/api/documents/{id}")
 async def get_document(id: str):
     """Get document by ID"""
-    if id in documents:
-        doc = documents[id]
+    doc = await documents.get(id)
+    if doc:
         return {
             "id": id,
             "filename": doc["filename"],
-            "text": doc["text"],
+            "text": await load_document_text(id),
             "summary": doc["summary"],
             "page_count": doc["page_count"],
             "word_count": doc["word_count"],
@@ -199,22 +300,22 @@ async def get_document(id: str):
         }
     raise HTTPException(status_code=404, detail="Document not found")
 
-@app.get("/api/documents/{id}/text")
+@app.get("/api/documents/{id}/text", response_class=PlainTextResponse)
 async def get_document_text(id: str):
-    """Get document text for quiz generation"""
-    if id in documents:
-        return {
-            "id": id,
-            "text": documents[id]["text"],
-            "word_count": documents[id]["word_count"]
-        }
+    """Get document text for quiz generation (raw body, word count in a header)"""
+    doc = await documents.get(id)
+    if doc:
+        return PlainTextResponse(
+            await load_document_text(id),
+            headers={"X-Word-Count": str(doc["word_count"])}
+        )
     raise HTTPException(status_code=404, detail="Document not found")
 
 @app.get("/api/documents")
-async def list_documents(limit: int = 20):
+async def list_documents(limit: int = Query(20, ge=0)):
     """List all documents"""
     items = []
-    for doc_id, doc in list(documents.items())[:limit]:
+    for doc_id, doc in await documents.items(limit):
         items.append({
             "id": doc_id,
             "filename": doc["filename"],
@@ -222,19 +323,31 @@ async def list_documents(limit: int = 20):
             "status": doc["status"],
             "created_at": doc["created_at"]
         })
-    return {"documents": items, "total": len(documents)}
+    return {"documents": items, "total": await documents.count()}
 
 @app.delete("/api/documents/{id}")
 async def delete_document(id: str):
     """Delete document"""
-    if id in documents:
-        del documents[id]
+    if await documents.delete(id):
+        await document_texts.delete(id)
         return {"message": "Deleted", "id": id}
     raise HTTPException(status_code=404, detail="Not found")
 
+@app.on_event("shutdown")
+def flush_kafka():
+    """Deliver buffered Kafka messages before the process exits"""
+    kafka_handler.flush()
+
+@app.on_event("shutdown")
+async def close_stores():
+    await documents.close()
+    await document_texts.close()
+    await extraction_cache.close()
+    extract_pool.shutdown()
+
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "documents", "version": "2.0", "doc_count": len(documents)}
+    return {"status": "healthy", "service": "documents", "version": "2.0", "doc_count": await documents.count()}
 
 if __name__ == "__main__":
     import uvicorn
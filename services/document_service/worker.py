@@ -1,7 +1,10 @@
+import io
 import os
 import sys
 import json
-import PyPDF2
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import fitz  # PyMuPDF
 from docx import Document as DocxDocument
 
 from services.common.kafka_handler import KafkaHandler
@@ -9,67 +12,97 @@ from services.common.s3_handler import S3Handler
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 DOC_S3_BUCKET = os.getenv("DOC_S3_BUCKET", "document-reader-storage-dev")
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "4"))
+DOC_EXTRACT_WORKERS = int(os.getenv("DOC_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+DOC_MAX_ATTEMPTS = int(os.getenv("DOC_MAX_ATTEMPTS", "3"))
 
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(DOC_S3_BUCKET)
 
-def extract_text(file_path):
-    ext = file_path.split('.')[-1].lower()
+# Documents from one poll are processed concurrently; a slow PDF no longer blocks the rest
+pool = ThreadPoolExecutor(max_workers=DOC_WORKERS)
+# PDF/DOCX parsing holds the GIL, so the threads hand extraction to worker processes and only
+# wait on S3/Kafka themselves. Spawned, not forked, since the parent already runs threads.
+extract_pool = ProcessPoolExecutor(
+    max_workers=DOC_EXTRACT_WORKERS,
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+def extract_text(content, ext):
     text = ""
     if ext == 'pdf':
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            for page in doc:
+                text += page.get_text("text")
     elif ext == 'docx':
-        doc = DocxDocument(file_path)
+        doc = DocxDocument(io.BytesIO(content))
         for para in doc.paragraphs:
             text += para.text + "\n"
     elif ext == 'txt':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        text = content.decode('utf-8')
     return text
 
+def process_document(data):
+    doc_id = data.get("id")
+    s3_key = data.get("s3_path")
+    
+    # Download from S3 straight into memory
+    content = s3_handler.download_bytes(s3_key)
+    if content is None:
+        raise RuntimeError(f"Could not download {s3_key}")
+    
+    # Extract text
+    text = extract_pool.submit(extract_text, content, s3_key.split('.')[-1].lower()).result()
+    
+    # Publish "document.processed" event
+    kafka_handler.send_message("document.processed", {
+        "id": doc_id,
+        "s3_path": s3_key  # Consumers read the document from S3, not from the event
+    })
+    
+    # Simulate Note Generation
+    notes = f"Summary of document {doc_id}:\n" + text[:500] + "..."
+    
+    # Save notes to S3
+    notes_key = f"notes/{doc_id}_notes.txt"
+    if s3_handler.upload_bytes(notes_key, notes.encode('utf-8')):
+        kafka_handler.send_message("notes.generated", {
+            "doc_id": doc_id,
+            "notes_s3_path": notes_key
+        })
+
+def process_document_safe(data):
+    """Process a document, retrying; a document that keeps failing is published as failed"""
+    error = None
+    for attempt in range(1, DOC_MAX_ATTEMPTS + 1):
+        try:
+            process_document(data)
+            return
+        except Exception as e:
+            error = e
+            print(f"Document processing error for {data.get('id')} (attempt {attempt}/{DOC_MAX_ATTEMPTS}): {e}")
+    
+    # Recorded before the batch's offsets are committed, so the failure is never silently dropped
+    kafka_handler.send_message("document.processing.failed", {
+        "id": data.get("id"),
+        "s3_path": data.get("s3_path"),
+        "error": str(error),
+        "attempts": DOC_MAX_ATTEMPTS
+    })
+
 def process_document_events():
-    consumer = kafka_handler.get_consumer("document.uploaded", "doc_worker_group")
+    consumer = kafka_handler.get_consumer("document.uploaded", "doc_worker_group", enable_auto_commit=False)
     
-    for message in consumer:
-        data = message.value
-        doc_id = data.get("id")
-        s3_key = data.get("s3_path")
-        
-        # Download from S3
-        local_path = f"temp_{doc_id}"
-        if s3_handler.download_file(s3_key, local_path):
-            # Extract text
-            text = extract_text(local_path)
-            
-            # Publish "document.processed" event
-            kafka_handler.send_message("document.processed", {
-                "id": doc_id,
-                "text": text[:2000], # Sending snippet for Kafka size limits, full text in S3
-                "s3_path": s3_key
-            })
-            
-            # Simulate Note Generation
-            notes = f"Summary of document {doc_id}:\n" + text[:500] + "..."
-            
-            # Save notes to S3
-            notes_key = f"notes/{doc_id}_notes.txt"
-            notes_path = f"temp_notes_{doc_id}.txt"
-            with open(notes_path, 'w', encoding='utf-8') as f:
-                f.write(notes)
-            
-            if s3_handler.upload_file(notes_path, notes_key):
-                kafka_handler.send_message("notes.generated", {
-                    "doc_id": doc_id,
-                    "notes_s3_path": notes_key
-                })
-            
-            # Cleanup
-            if os.path.exists(local_path): os.remove(local_path)
-            if os.path.exists(notes_path): os.remove(notes_path)
+    # Offsets are committed only after every document in the batch has finished
+    while True:
+        records = consumer.poll(timeout_ms=200, max_records=DOC_WORKERS * 4)
+        if not records:
+            continue
+        batch = [message.value for messages in records.values() for message in messages]
+        list(pool.map(process_document_safe, batch))
+        # Deliver this batch's events (including failure records) before committing past it
+        kafka_handler.flush()
+        consumer.commit()
 
 if __name__ == "__main__":
     process_document_events()
-Line 1: # document_service/worker.py
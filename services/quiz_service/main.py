@@ -1,5 +1,7 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 import os
+import re
 import uuid
 import random
 import json
@@ -9,8 +11,9 @@ from typing import List, Optional, Dict
 from datetime import datetime
 
 from services.common.kafka_handler import KafkaHandler
+from services.common.store import Store
 
-app = FastAPI(title="Quiz Generator Service")
+app = FastAPI(title="Quiz Generator Service", default_response_class=ORJSONResponse)
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 DOC_SERVICE_URL = os.getenv("DOC_SERVICE_URL", "http://document-service:8003")
@@ -18,8 +21,8 @@ DOC_SERVICE_URL = os.getenv("DOC_SERVICE_URL", "http://document-service:8003")
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 
 # Storage
-quizzes = {}
-quiz_results = {}
+quizzes = Store("quiz")
+quiz_results = Store("quiz_results")
 
 class Question(BaseModel):
     id: int
@@ -44,37 +47,32 @@ class QuizResponse(BaseModel):
 class SubmitRequest(BaseModel):
     answers: Dict[int, str]
 
+# Sentence boundary: terminal punctuation followed by whitespace
+_SENT_RE = re.compile(r'[.!?]+\s+')
+
 # Basic question templates for generating from text
-def generate_questions_from_text(text: str, num_questions: int = 5) -> List[dict]:
+def generate_questions_from_text(text: str, num_questions: int = 5, rng: Optional[random.Random] = None) -> List[dict]:
     """Generate quiz questions from document text using AI-like analysis"""
     if not text or len(text) < 50:
         return []
+    rng = rng or random.Random()
     
     questions = []
-    sentences = text.replace('\n', ' ').split('.')
-    sentences = [s.strip() for s in sentences if len(s.strip()) > 20]
+    sentences = [s for s in (part.strip() for part in _SENT_RE.split(text)) if len(s) > 20]
     
     if not sentences:
         return []
     
-    # Extract key phrases and generate questions
-    used_sentences = set()
-    
-    for i in range(min(num_questions, len(sentences))):
-        # Pick a random sentence
-        available = [s for j, s in enumerate(sentences) if j not in used_sentences]
-        if not available:
-            break
-            
-        sentence = random.choice(available)
-        used_sentences.add(sentences.index(sentence))
+    # Extract key phrases and generate questions from distinct random sentences
+    for j in rng.sample(range(len(sentences)), min(num_questions, len(sentences))):
+        sentence = sentences[j].replace('\n', ' ')
         
         # Find important words
         words = sentence.split()
         important_words = [w for w in words if len(w) > 4]
         
         if important_words:
-            keyword = random.choice(important_words)
+            keyword = rng.choice(important_words)
             
             # Create fill-in-the-blank style question
             questions.append({
@@ -104,22 +102,45 @@ FALLBACK_QUESTIONS = {
     ]
 }
 
+@app.on_event("startup")
+async def create_http_client():
+    """Shared keep-alive client for Document Service calls"""
+    app.state.http = httpx.AsyncClient(
+        timeout=10.0,
+        base_url=DOC_SERVICE_URL,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100)
+    )
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http.aclose()
+
 async def fetch_document_text(document_id: str) -> Optional[str]:
     """Fetch document text from Document Service"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{DOC_SERVICE_URL}/api/documents/{document_id}/text")
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("text", "")
+        response = await app.state.http.get(f"/api/documents/{document_id}/text")
+        if response.status_code == 200:
+            return response.text
     except Exception as e:
         print(f"Error fetching document: {e}")
     return None
 
+def question_dict(question_id: int, q: dict) -> dict:
+    """Shape a generated/bank question like Question; models are built only in QuizResponse"""
+    return {
+        "id": question_id,
+        "question": q["q"],
+        "options": q["options"],
+        "answer": q["answer"],
+        "explanation": q.get("explanation")
+    }
+
 @app.post("/api/quiz/generate", response_model=QuizResponse)
 async def generate_quiz(request: QuizRequest):
     """Generate quiz - from document or topic"""
     quiz_id = str(uuid.uuid4())
+    # Per-request generator seeded from the quiz id: no shared global state, reproducible quizzes
+    rng = random.Random(quiz_id)
     questions = []
     source_doc = None
     topic = request.topic or "general"
@@ -133,38 +154,23 @@ async def generate_quiz(request: QuizRequest):
             topic = f"document-{request.document_id[:8]}"
             
             # Generate questions from document text
-            generated = generate_questions_from_text(doc_text, request.num_questions)
+            generated = generate_questions_from_text(doc_text, request.num_questions, rng)
             
-            for i, q in enumerate(generated):
-                questions.append(Question(
-                    id=i + 1,
-                    question=q["q"],
-                    options=q["options"],
-                    answer=q["answer"],
-                    explanation=q.get("explanation")
-                ))
+            questions = [question_dict(i + 1, q) for i, q in enumerate(generated)]
     
     # If no questions yet, use fallback
     if not questions:
         pool = FALLBACK_QUESTIONS.get(topic, FALLBACK_QUESTIONS["general"])
-        selected = random.sample(pool, min(request.num_questions, len(pool)))
-        
-        for i, q in enumerate(selected):
-            questions.append(Question(
-                id=i + 1,
-                question=q["q"],
-                options=q["options"],
-                answer=q["answer"],
-                explanation=q.get("explanation")
-            ))
+        selected = rng.sample(pool, min(request.num_questions, len(pool)))
+        questions = [question_dict(i + 1, q) for i, q in enumerate(selected)]
     
     # Store quiz
-    quizzes[quiz_id] = {
+    await quizzes.set(quiz_id, {
         "topic": topic,
         "questions": questions,
         "source_document": source_doc,
         "created_at": datetime.utcnow().isoformat()
-    }
+    })
     
     # Kafka event
     try:
@@ -189,12 +195,12 @@ async def generate_quiz(request: QuizRequest):
 @app.get("/api/quiz/{id}")
 async def get_quiz(id: str):
     """Get quiz by ID"""
-    if id in quizzes:
-        quiz = quizzes[id]
+    quiz = await quizzes.get(id)
+    if quiz:
         return {
             "id": id,
             "topic": quiz["topic"],
-            "questions": [q.dict() for q in quiz["questions"]],
+            "questions": quiz["questions"],
             "source_document": quiz.get("source_document"),
             "created_at": quiz["created_at"]
         }
@@ -203,10 +209,10 @@ async def get_quiz(id: str):
 @app.post("/api/quiz/{id}/submit")
 async def submit_quiz(id: str, submission: SubmitRequest):
     """Submit quiz answers"""
-    if id not in quizzes:
+    quiz = await quizzes.get(id)
+    if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    quiz = quizzes[id]
     questions = quiz["questions"]
     
     correct = []
@@ -214,21 +220,21 @@ async def submit_quiz(id: str, submission: SubmitRequest):
     details = []
     
     for q in questions:
-        user_answer = submission.answers.get(q.id, "")
-        is_correct = user_answer == q.answer
+        user_answer = submission.answers.get(q["id"], "")
+        is_correct = user_answer == q["answer"]
         
         if is_correct:
-            correct.append(q.id)
+            correct.append(q["id"])
         else:
-            wrong.append(q.id)
+            wrong.append(q["id"])
         
         details.append({
-            "question_id": q.id,
-            "question": q.question,
+            "question_id": q["id"],
+            "question": q["question"],
             "your_answer": user_answer,
-            "correct_answer": q.answer,
+            "correct_answer": q["answer"],
             "is_correct": is_correct,
-            "explanation": q.explanation
+            "explanation": q.get("explanation")
         })
     
     score = len(correct)
@@ -256,29 +262,28 @@ async def submit_quiz(id: str, submission: SubmitRequest):
     }
     
     # Store result
-    if id not in quiz_results:
-        quiz_results[id] = []
-    quiz_results[id].append(result)
+    await quiz_results.append(id, result)
     
     return result
 
 @app.get("/api/quiz/{id}/results")
 async def get_results(id: str):
     """Get quiz results"""
-    if id not in quizzes:
+    quiz = await quizzes.get(id)
+    if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     return {
         "quiz_id": id,
-        "attempts": quiz_results.get(id, []),
-        "questions": [{"id": q.id, "question": q.question, "answer": q.answer} for q in quizzes[id]["questions"]]
+        "attempts": await quiz_results.get_list(id),
+        "questions": [{"id": q["id"], "question": q["question"], "answer": q["answer"]} for q in quiz["questions"]]
     }
 
 @app.get("/api/quiz/history")
-async def quiz_history(limit: int = 10):
+async def quiz_history(limit: int = Query(10, ge=0)):
     """Get quiz history"""
     items = []
-    for qid, quiz in list(quizzes.items())[:limit]:
+    for qid, quiz in await quizzes.items(limit):
         items.append({
             "id": qid,
             "topic": quiz["topic"],
@@ -288,6 +293,16 @@ async def quiz_history(limit: int = 10):
         })
     return {"quizzes": items}
 
+@app.on_event("shutdown")
+def flush_kafka():
+    """Deliver buffered Kafka messages before the process exits"""
+    kafka_handler.flush()
+
+@app.on_event("shutdown")
+async def close_stores():
+    await quizzes.close()
+    await quiz_results.close()
+
 @app.get("/health")
 async def health():
     return {"status": "healthy", "service": "quiz", "version": "2.0"}
@@ -1,28 +1,43 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import os
 import uuid
-import tempfile
 import wave
 import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
+from services.common.uploads import save_upload_to_temp
+from services.common.store import Store
 
-app = FastAPI(title="STT Service - Speech to Text")
+app = FastAPI(title="STT Service - Speech to Text", default_response_class=ORJSONResponse)
 
 # Configuration
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 S3_BUCKET = os.getenv("STT_S3_BUCKET", "stt-service-storage-dev")
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+WHISPER_CPU_THREADS = max(1, (os.cpu_count() or 1) // WHISPER_NUM_WORKERS)
+STT_FALLBACK_WORKERS = int(os.getenv("STT_FALLBACK_WORKERS", "4"))
 
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(S3_BUCKET)
 
 # Storage
-transcriptions = {}
+transcriptions = Store("stt")
+# Recognized transcripts keyed by sha256 of the audio bytes, so duplicate uploads skip inference
+TRANSCRIPT_CACHE_TTL = int(os.getenv("STT_TRANSCRIPT_CACHE_TTL", str(7 * 86400)))
+transcript_cache = Store("stt_cache", ttl=TRANSCRIPT_CACHE_TTL)
+
+# Whisper inference runs off the event loop, one thread per model worker so they run concurrently
+whisper_pool = ThreadPoolExecutor(max_workers=WHISPER_NUM_WORKERS)
+# The SpeechRecognition fallback (PyAV decode + blocking Google call) gets its own threads,
+# so it neither blocks the event loop nor queues behind Whisper inference
+fallback_pool = ThreadPoolExecutor(max_workers=STT_FALLBACK_WORKERS)
 
 class TranscriptionResponse(BaseModel):
     id: str
@@ -32,33 +47,33 @@ class TranscriptionResponse(BaseModel):
     language: Optional[str] = None
     confidence: Optional[float] = None
 
+def decode_audio_pcm(audio_path: str) -> bytes:
+    """Decode any audio container to 16 kHz mono 16-bit PCM in memory"""
+    import av
+    
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=16000)
+    pcm = bytearray()
+    with av.open(audio_path) as container:
+        stream = container.streams.audio[0]
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                pcm += out.to_ndarray().tobytes()
+        # Flush samples buffered inside the resampler
+        for out in resampler.resample(None):
+            pcm += out.to_ndarray().tobytes()
+    return bytes(pcm)
+
 def transcribe_with_speech_recognition(audio_path: str, language: str = "en") -> dict:
     """Transcribe using SpeechRecognition library"""
     try:
         import speech_recognition as sr
         
         recognizer = sr.Recognizer()
-        
-        # Convert to WAV if needed using pydub
-        wav_path = audio_path
-        if not audio_path.endswith('.wav'):
-            try:
-                from pydub import AudioSegment
-                audio = AudioSegment.from_file(audio_path)
-                wav_path = audio_path + ".wav"
-                audio.export(wav_path, format="wav")
-            except Exception as e:
-                print(f"Pydub conversion failed: {e}")
-        
-        with sr.AudioFile(wav_path) as source:
-            audio_data = recognizer.record(source)
+        audio_data = sr.AudioData(decode_audio_pcm(audio_path), 16000, 2)
         
         # Try Google Speech Recognition
         lang_code = "ar-SA" if language == "ar" else "en-US"
         text = recognizer.recognize_google(audio_data, language=lang_code)
-        
-        if wav_path != audio_path and os.path.exists(wav_path):
-            os.unlink(wav_path)
             
         return {
             "text": text,
@@ -73,17 +88,33 @@ def transcribe_with_speech_recognition(audio_path: str, language: str = "en") ->
             "status": "error"
         }
 
-def transcribe_with_whisper(audio_path: str) -> dict:
-    """Transcribe using OpenAI Whisper"""
+@app.on_event("startup")
+def load_whisper_model():
+    """Load the Whisper model once per process"""
     try:
-        import whisper
-        model = whisper.load_model("base")
-        result = model.transcribe(audio_path)
+        from faster_whisper import WhisperModel
+        app.state.whisper = WhisperModel(
+            "base",
+            device="cpu",
+            compute_type="int8",
+            cpu_threads=WHISPER_CPU_THREADS,
+            num_workers=WHISPER_NUM_WORKERS
+        )
+    except Exception as e:
+        print(f"Whisper load error: {e}")
+        app.state.whisper = None
+
+def transcribe_with_whisper(model, audio_path: str) -> dict:
+    """Transcribe using the preloaded faster-whisper model"""
+    if model is None:
+        return None
+    try:
+        segments, info = model.transcribe(audio_path, beam_size=1, vad_filter=True)
         return {
-            "text": result["text"],
+            "text": "".join(seg.text for seg in segments),
             "confidence": 0.95,
             "status": "completed",
-            "language": result.get("language", "unknown")
+            "language": info.language or "unknown"
         }
     except Exception as e:
         print(f"Whisper error: {e}")
@@ -96,20 +127,26 @@ async def transcribe_audio(
 ):
     """Upload audio file and transcribe to text (Bilingual Support)"""
     file_id = str(uuid.uuid4())
-    content = await file.read()
-    file_size = len(content)
     file_ext = file.filename.split('.')[-1] if '.' in file.filename else 'wav'
+    temp_path, file_size, digest = await save_upload_to_temp(file, f'.{file_ext}')
     
-    temp_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
-        
-        # Try Whisper first
-        result = transcribe_with_whisper(temp_path)
+        # The Google fallback is language-specific, so the language is part of the key
+        cache_key = f"{digest}:{language}"
+        result = await transcript_cache.get(cache_key)
         if not result:
-            result = transcribe_with_speech_recognition(temp_path, language)
+            # Try Whisper first
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                whisper_pool, transcribe_with_whisper, app.state.whisper, temp_path
+            )
+            if not result:
+                result = await loop.run_in_executor(
+                    fallback_pool, transcribe_with_speech_recognition, temp_path, language
+                )
+            
+            if result and result["status"] == "completed" and result["text"]:
+                await transcript_cache.set(cache_key, result)
         
         if not result or result["status"] == "error" or not result["text"]:
             result = {
@@ -125,7 +162,7 @@ Possible reasons: Poor quality, background noise, or unsupported format.""",
                 "status": "completed"
             }
         
-        transcriptions[file_id] = {
+        await transcriptions.set(file_id, {
             "text": result["text"],
             "filename": file.filename,
             "language": language,
@@ -133,7 +170,7 @@ Possible reasons: Poor quality, background noise, or unsupported format.""",
             "status": result["status"],
             "file_size": file_size,
             "created_at": datetime.utcnow().isoformat()
-        }
+        })
         
         try:
             kafka_handler.send_message("audio.transcription.completed", {
@@ -153,15 +190,25 @@ Possible reasons: Poor quality, background noise, or unsupported format.""",
             confidence=result.get("confidence")
         )
     finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
+        os.unlink(temp_path)
 
 @app.get("/api/stt/transcription/{id}")
 async def get_transcription(id: str):
-    if id in transcriptions:
-        return {"id": id, **transcriptions[id]}
+    transcription = await transcriptions.get(id)
+    if transcription:
+        return {"id": id, **transcription}
     raise HTTPException(status_code=404, detail="Transcription not found")
 
+@app.on_event("shutdown")
+def flush_kafka():
+    """Deliver buffered Kafka messages before the process exits"""
+    kafka_handler.flush()
+
+@app.on_event("shutdown")
+async def close_stores():
+    await transcriptions.close()
+    await transcript_cache.close()
+
 @app.get("/health")
 async def health():
     return {"status": "healthy", "service": "stt", "version": "3.0"}
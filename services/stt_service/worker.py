@@ -1,19 +1,26 @@
 import os
 import sys
 import json
-import whisper
+from faster_whisper import WhisperModel
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 STT_S3_BUCKET = os.getenv("STT_S3_BUCKET", "stt-service-storage-dev")
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
 
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(STT_S3_BUCKET)
 
-# Load Whisper model
-model = whisper.load_model("base")
+# Load Whisper model (CTranslate2 INT8, threads split across model workers)
+model = WhisperModel(
+    "base",
+    device="cpu",
+    compute_type="int8",
+    cpu_threads=max(1, (os.cpu_count() or 1) // WHISPER_NUM_WORKERS),
+    num_workers=WHISPER_NUM_WORKERS
+)
 
 def process_transcription_request():
     consumer = kafka_handler.get_consumer("audio.transcription.requested", "stt_worker_group")
@@ -27,8 +34,8 @@ def process_transcription_request():
         local_path = f"temp_{file_id}"
         if s3_handler.download_file(s3_key, local_path):
             # Transcribe
-            result = model.transcribe(local_path)
-            transcription_text = result["text"]
+            segments, info = model.transcribe(local_path, beam_size=1, vad_filter=True)
+            transcription_text = "".join(seg.text for seg in segments)
             
             # Send completion message
             kafka_handler.send_message("audio.transcription.completed", {
@@ -42,4 +49,3 @@ def process_transcription_request():
 
 if __name__ == "__main__":
     process_transcription_request()
-Line 1: # stt_service/worker.py
@@ -0,0 +1,22 @@
+"""Content-addressed audio keys shared by the TTS HTTP service and the Kafka worker"""
+import hashlib
+import unicodedata
+
+# Map common language codes to gTTS codes
+GTTS_LANGUAGES = {"ar": "ar", "en": "en", "fr": "fr", "de": "de", "es": "es", "zh": "zh-CN"}
+
+def gtts_language(language: str) -> str:
+    """gTTS code for a request language; unknown codes fall back to Arabic"""
+    return GTTS_LANGUAGES.get(language, "ar")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and NFC-normalize so equivalent phrases hash alike"""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+def cache_key(text: str, language: str, engine: str = "gtts") -> str:
+    """SHA-256 of the engine, its resolved language/voice and the text; speed is left out since gTTS ignores it"""
+    return hashlib.sha256(f"{engine}|{language}|{text}".encode()).hexdigest()
+
+def s3_key(key: str) -> str:
+    """S3 object holding the MP3 for a cache key, written by whichever path synthesized it first"""
+    return f"tts/{key}/speech.mp3"
@@ -1,27 +1,153 @@
-from fastapi import FastAPI, HTTPException, Response
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 import os
+import re
 import uuid
-import tempfile
+import subprocess
 import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from gtts import gTTS
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Literal, NamedTuple, Optional
 from datetime import datetime
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
+from services.tts_service.cache import cache_key, gtts_language, normalize_text, s3_key
 
-app = FastAPI(title="TTS Service - Text to Speech")
+app = FastAPI(title="TTS Service - Text to Speech", default_response_class=ORJSONResponse)
 
 # Configuration
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 S3_BUCKET = os.getenv("TTS_S3_BUCKET", "tts-service-storage-dev")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "/data/tts-cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Disk budget for TTS_CACHE_DIR; a periodic sweep removes least recently used files past it
+TTS_DISK_CACHE_MAX_BYTES = int(os.getenv("TTS_DISK_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+TTS_DISK_CACHE_SWEEP_SECONDS = int(os.getenv("TTS_DISK_CACHE_SWEEP_SECONDS", "60"))
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "8"))
+# Texts shorter than this are synthesized locally with espeak-ng instead of gTTS
+TTS_LOCAL_MAX_CHARS = int(os.getenv("TTS_LOCAL_MAX_CHARS", "40"))
+REDIS_URL = os.getenv("REDIS_URL")
+TTS_AUDIO_TTL = int(os.getenv("TTS_AUDIO_TTL", "3600"))
 
-kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
+# Completion events are fire-and-forget; linger longer so bursts share one produce request
+kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS, linger_ms=20, batch_size=128 * 1024)
 s3_handler = S3Handler(S3_BUCKET)
 
-# In-memory storage for audio files
-audio_storage = {}
+# gTTS makes blocking HTTPS calls, so synthesis runs on threads off the event loop
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+
+class AudioEntry(NamedTuple):
+    """Stored synthesis; a tuple is far smaller per entry than a dict"""
+    path: Optional[str]
+    audio: Optional[bytes]
+    # Content key; the audio is also published at s3_key(key) for other instances
+    key: Optional[str]
+    text: str
+    language: str
+    created_at: str
+
+class BoundedAudioStore:
+    """LRU mapping of audio entries, evicting least recently used ones past max_bytes"""
+    
+    # Rough per-entry cost of the metadata, so file-backed entries are bounded too
+    ENTRY_OVERHEAD = 1024
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+    
+    def _size(self, entry: AudioEntry) -> int:
+        return self.ENTRY_OVERHEAD + len(entry.audio or b"")
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+    
+    def __getitem__(self, key: str) -> AudioEntry:
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        return entry
+    
+    def __setitem__(self, key: str, entry: AudioEntry):
+        if key in self._entries:
+            del self[key]
+        self._entries[key] = entry
+        self.total_bytes += self._size(entry)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= self._size(evicted)
+    
+    def __delitem__(self, key: str):
+        self.total_bytes -= self._size(self._entries.pop(key))
+    
+    async def get(self, key: str) -> Optional[AudioEntry]:
+        return self[key] if key in self else None
+    
+    async def set(self, key: str, entry: AudioEntry):
+        self[key] = entry
+    
+    async def delete(self, key: str) -> bool:
+        if key not in self:
+            return False
+        del self[key]
+        return True
+    
+    async def close(self):
+        pass
+
+class RedisAudioStore:
+    """Audio entries as Redis hashes with a TTL, shared by every uvicorn worker"""
+    
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+    
+    async def get(self, key: str) -> Optional[AudioEntry]:
+        fields = await self.redis.hgetall(f"tts:{key}")
+        if not fields:
+            return None
+        path = fields.get(b"path")
+        cache_key = fields.get(b"key")
+        return AudioEntry(
+            path=path.decode() if path else None,
+            audio=fields.get(b"audio"),
+            key=cache_key.decode() if cache_key else None,
+            text=fields[b"text"].decode(),
+            language=fields[b"language"].decode(),
+            created_at=fields[b"created_at"].decode()
+        )
+    
+    async def set(self, key: str, entry: AudioEntry):
+        mapping = {k: v for k, v in entry._asdict().items() if v is not None}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(f"tts:{key}", mapping=mapping)
+            pipe.expire(f"tts:{key}", self.ttl)
+            await pipe.execute()
+    
+    async def delete(self, key: str) -> bool:
+        return await self.redis.delete(f"tts:{key}") > 0
+    
+    async def close(self):
+        await self.redis.aclose()
+
+# Audio metadata (the audio itself lives in the disk cache when available):
+# Redis when configured so any worker can serve any id, otherwise this process's LRU
+if REDIS_URL:
+    audio_storage = RedisAudioStore(REDIS_URL, TTS_AUDIO_TTL)
+else:
+    audio_storage = BoundedAudioStore(TTS_CACHE_MAX_BYTES)
+
+# Content-addressed MP3 cache so repeated phrases skip the gTTS round-trip
+try:
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+except OSError as e:
+    print(f"TTS disk cache disabled: {e}")
+    TTS_CACHE_DIR = None
 
 class TTSRequest(BaseModel):
     text: str
@@ -35,134 +161,494 @@ class TTSResponse(BaseModel):
     audio_url: Optional[str] = None
     text_preview: Optional[str] = None
 
-def generate_audio_gtts(text: str, language: str) -> bytes:
-    """Generate audio using gTTS"""
+def generate_audio_gtts(text: str, lang: str) -> bytes:
+    """Generate audio using gTTS (lang is an already resolved gTTS code)"""
     try:
-        from gtts import gTTS
-        
-        # Map common language codes
-        lang_map = {
-            "ar": "ar",
-            "en": "en",
-            "fr": "fr",
-            "de": "de",
-            "es": "es",
-            "zh": "zh-CN",
-        }
-        lang = lang_map.get(language, "ar")
-        
         # Create TTS
         tts = gTTS(text=text, lang=lang, slow=False)
         
-        # Save to bytes
+        # Save to bytes (getvalue copies the buffer once, no seek/read round-trip)
         audio_buffer = io.BytesIO()
         tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
-        
-        return audio_buffer.read()
+        return audio_buffer.getvalue()
     except Exception as e:
         print(f"gTTS error: {e}")
         raise
 
-@app.post("/api/tts/synthesize", response_model=TTSResponse)
+def cached_audio_path(key: str) -> Optional[str]:
+    """Path of a cached MP3, or None on a miss"""
+    if TTS_CACHE_DIR is None:
+        return None
+    path = os.path.join(TTS_CACHE_DIR, key + ".mp3")
+    return path if touch_cached_file(path) else None
+
+def touch_cached_file(path: str) -> bool:
+    """Mark a cache file as recently used for the sweep; False if it does not exist"""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+def sweep_disk_cache():
+    """Delete least recently used cache files until the directory fits TTS_DISK_CACHE_MAX_BYTES"""
+    files = []
+    total = 0
+    with os.scandir(TTS_CACHE_DIR) as entries:
+        for entry in entries:
+            # In-progress writes end in .tmp and are left alone
+            if not entry.name.endswith(".mp3"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= TTS_DISK_CACHE_MAX_BYTES:
+        return
+    files.sort()
+    for _, size, path in files:
+        if total <= TTS_DISK_CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"TTS cache eviction error: {e}")
+            continue
+        total -= size
+
+async def _disk_cache_sweeper():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(TTS_DISK_CACHE_SWEEP_SECONDS)
+        try:
+            await loop.run_in_executor(None, sweep_disk_cache)
+        except OSError as e:
+            print(f"TTS cache sweep error: {e}")
+
+@app.on_event("startup")
+async def start_disk_cache_sweeper():
+    app.state.sweeper_task = asyncio.create_task(_disk_cache_sweeper()) if TTS_CACHE_DIR else None
+
+@app.on_event("shutdown")
+async def stop_disk_cache_sweeper():
+    if app.state.sweeper_task is not None:
+        app.state.sweeper_task.cancel()
+
+def write_cached_audio(key: str, audio_bytes: bytes, quality: Optional[str] = None) -> Optional[str]:
+    """Atomically write an MP3 (or a lower-quality variant) into the cache; returns its path, or None if caching failed"""
+    if TTS_CACHE_DIR is None:
+        return None
+    path = os.path.join(TTS_CACHE_DIR, f"{key}.{quality}.mp3" if quality else key + ".mp3")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        print(f"TTS cache write error: {e}")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return None
+
+# Lower-bitrate renditions for slow networks; gTTS itself emits ~32 kbps mono MP3
+AUDIO_VARIANTS = {
+    "med": ["-b:a", "24k"],
+    "low": ["-b:a", "16k", "-ar", "16000"],
+}
+
+def encode_variant(audio_bytes: bytes, args: List[str]) -> bytes:
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "mp3", "-i", "pipe:0", "-ac", "1", *args, "-f", "mp3", "pipe:1"],
+        input=audio_bytes, capture_output=True, check=True, timeout=30
+    ).stdout
+
+def write_audio_variants(key: str, audio_bytes: bytes):
+    """Encode each lower quality once at synthesis time, so serving one is a plain file read"""
+    for quality, args in AUDIO_VARIANTS.items():
+        try:
+            write_cached_audio(key, encode_variant(audio_bytes, args), quality)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"TTS variant encode error ({quality}): {e}")
+            return
+
+def variant_path(path: str, quality: str) -> str:
+    """Cached rendition of path at quality, falling back to the original until it is encoded"""
+    if quality not in AUDIO_VARIANTS:
+        return path
+    candidate = f"{path[:-len('.mp3')]}.{quality}.mp3"
+    return candidate if touch_cached_file(candidate) else path
+
+def fetch_shared_audio(key: str) -> Optional[bytes]:
+    """Audio already in S3 under the content key (from another instance or the worker), or None"""
+    object_name = s3_key(key)
+    try:
+        if s3_handler.object_exists(object_name):
+            return s3_handler.download_bytes(object_name)
+    except Exception as e:
+        print(f"S3 cache lookup error: {e}")
+    return None
+
+def store_shared_audio(key: str, audio_bytes: bytes):
+    try:
+        s3_handler.upload_bytes(s3_key(key), audio_bytes)
+    except Exception as e:
+        print(f"S3 cache upload error: {e}")
+
+# gTTS sends at most this many characters per upstream request
+GTTS_CHUNK_CHARS = 100
+# Split after sentence/clause punctuation (Latin and Arabic)
+_CHUNK_BOUNDARY_RE = re.compile(r'(?<=[.!?;:,\u061f\u060c\u061b])\s+')
+
+def split_text_chunks(text: str, max_chars: int = GTTS_CHUNK_CHARS) -> List[str]:
+    """Pack sentences into chunks of at most max_chars, breaking long sentences on spaces"""
+    chunks = []
+    current = ""
+    for sentence in _CHUNK_BOUNDARY_RE.split(text.strip()):
+        pieces = [sentence] if len(sentence) <= max_chars else sentence.split()
+        for piece in pieces:
+            while len(piece) > max_chars:
+                # A single word longer than a chunk is cut where it overflows
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            candidate = f"{current} {piece}" if current else piece
+            if len(candidate) <= max_chars:
+                current = candidate
+            else:
+                chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+# espeak-ng voices for the languages it handles acceptably
+_LOCAL_VOICES = {"ar": "ar", "en": "en", "fr": "fr", "de": "de", "es": "es", "zh": "cmn"}
+
+def generate_audio_local(text: str, language: str) -> bytes:
+    """Generate MP3 locally: espeak-ng WAV piped through ffmpeg"""
+    wav = subprocess.run(
+        ["espeak-ng", "-v", _LOCAL_VOICES[language], "--stdout", "--stdin"],
+        input=text.encode("utf-8"), capture_output=True, check=True, timeout=10
+    ).stdout
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "wav", "-i", "pipe:0", "-f", "mp3", "pipe:1"],
+        input=wav, capture_output=True, check=True, timeout=10
+    ).stdout
+
+async def synthesize_local(text: str, language: str) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tts_executor, generate_audio_local, text, language)
+
+async def synthesize_chunks(text: str, lang: str) -> bytes:
+    """Synthesize ~100-char chunks concurrently and join the MP3 fragments in order"""
+    chunks = split_text_chunks(text) or [text]
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(_tts_executor, generate_audio_gtts, chunk, lang)
+        for chunk in chunks
+    ))
+    return b"".join(parts)
+
+# created_at only needs second resolution, so a background tick refreshes it
+_now_iso = datetime.utcnow().isoformat()
+
+async def _tick():
+    global _now_iso
+    while True:
+        _now_iso = datetime.utcnow().isoformat()
+        await asyncio.sleep(1)
+
+@app.on_event("startup")
+async def start_clock():
+    app.state.clock_task = asyncio.create_task(_tick())
+
+@app.on_event("shutdown")
+async def stop_clock():
+    app.state.clock_task.cancel()
+
+# Completion events are queued and produced off the request path in batches
+KAFKA_QUEUE_MAXSIZE = 10000
+KAFKA_DRAIN_BATCH = 500
+_kafka_queue: asyncio.Queue = asyncio.Queue(maxsize=KAFKA_QUEUE_MAXSIZE)
+
+def send_completion_events(batch: List[dict]):
+    for message in batch:
+        try:
+            kafka_handler.send_message("audio.generation.completed", message)
+        except Exception as e:
+            print(f"Kafka error: {e}")
+
+async def _kafka_drain():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _kafka_queue.get()]
+        while not _kafka_queue.empty() and len(batch) < KAFKA_DRAIN_BATCH:
+            batch.append(_kafka_queue.get_nowait())
+        await loop.run_in_executor(None, send_completion_events, batch)
+
+@app.on_event("startup")
+async def start_kafka_drain():
+    app.state.kafka_drain_task = asyncio.create_task(_kafka_drain())
+
+# Concurrent requests for the same normalized text share one synthesis
+_inflight: Dict[str, asyncio.Future] = {}
+
+class SynthesisAbandoned(Exception):
+    """The request leading a shared synthesis was cancelled before it finished"""
+
+async def get_or_synthesize(text: str, language: str) -> tuple:
+    """Short prompts go to the local engine (no network round-trip); everything else to gTTS"""
+    # Each engine has its own key, so a phrase's voice never depends on which path cached it first
+    if len(text) < TTS_LOCAL_MAX_CHARS and language in _LOCAL_VOICES:
+        key = cache_key(text, _LOCAL_VOICES[language], engine="espeak")
+        try:
+            return await cached_synthesis(key, synthesize_local, text, language)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Local TTS unavailable, falling back to gTTS: {e}")
+    lang = gtts_language(language)
+    return await cached_synthesis(cache_key(text, lang), synthesize_chunks, text, lang)
+
+async def cached_synthesis(key: str, synthesize, text: str, language: str) -> tuple:
+    """(key, cache path, audio bytes) for key; bytes are None when served from the disk cache"""
+    while True:
+        path = cached_audio_path(key)
+        if path is not None:
+            return key, path, None
+        
+        pending = _inflight.get(key)
+        if pending is None:
+            break
+        try:
+            return await asyncio.shield(pending)
+        except SynthesisAbandoned:
+            # The leader's client went away; retry, leading the synthesis if nobody else has
+            continue
+    
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _inflight[key] = future
+    try:
+        audio_bytes = await loop.run_in_executor(_tts_executor, fetch_shared_audio, key)
+        if audio_bytes is None:
+            audio_bytes = await synthesize(text, language)
+            # Publish for other instances in the background; the response doesn't wait on S3
+            loop.run_in_executor(_tts_executor, store_shared_audio, key, audio_bytes)
+        path = write_cached_audio(key, audio_bytes)
+        if path is not None:
+            loop.run_in_executor(_tts_executor, write_audio_variants, key, audio_bytes)
+        result = (key, path, audio_bytes)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        # Followers are still connected, so release them to retry instead of cancelling them
+        future.set_exception(SynthesisAbandoned())
+        future.exception()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so a burst with no followers doesn't log "never retrieved"
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+
+# TTSResponse documents the schema only; the body is built directly, skipping response validation
+@app.post("/api/tts/synthesize", responses={200: {"model": TTSResponse}})
 async def synthesize_speech(request: TTSRequest):
     """Convert text to speech and return audio"""
     request_id = str(uuid.uuid4())
+    # Slice once; the 50-char preview comes from the 100-char one, not the full text
+    preview100 = request.text[:100]
+    preview50 = preview100[:50]
     
     try:
-        # Generate audio
-        audio_bytes = generate_audio_gtts(request.text, request.language)
+        text = normalize_text(request.text)
+        key, path, audio_bytes = await get_or_synthesize(text, request.language)
         
-        # Store in memory
-        audio_storage[request_id] = {
-            "audio": audio_bytes,
-            "text": request.text,
-            "language": request.language,
-            "created_at": datetime.utcnow().isoformat()
-        }
+        # Keep bytes in memory only when the disk cache could not hold them
+        await audio_storage.set(request_id, AudioEntry(
+            path=path,
+            audio=None if path else audio_bytes,
+            key=key,
+            text=request.text,
+            language=request.language,
+            created_at=_now_iso
+        ))
         
-        # Log to Kafka
+        # Log to Kafka; dropped rather than delaying the response when the queue is full
         try:
-            kafka_handler.send_message("audio.generation.completed", {
+            _kafka_queue.put_nowait({
                 "id": request_id,
-                "text_preview": request.text[:50],
+                "text_preview": preview50,
                 "language": request.language,
                 "status": "completed"
             })
-        except Exception as e:
-            print(f"Kafka error: {e}")
+        except asyncio.QueueFull:
+            print("Kafka queue full, dropping completion event")
         
-        return TTSResponse(
-            id=request_id,
-            status="completed",
-            message="✅ Audio file generated successfully!",
-            audio_url=f"/api/tts/audio/{request_id}/download",
-            text_preview=request.text[:100] if len(request.text) > 100 else request.text
-        )
+        return ORJSONResponse({
+            "id": request_id,
+            "status": "completed",
+            "message": "✅ Audio file generated successfully!",
+            "audio_url": f"/api/tts/audio/{request_id}/download",
+            "text_preview": preview100
+        })
         
     except Exception as e:
-        return TTSResponse(
-            id=request_id,
-            status="error",
-            message=f"❌ Error generating audio: {str(e)}",
-            text_preview=request.text[:50]
-        )
+        return ORJSONResponse({
+            "id": request_id,
+            "status": "error",
+            "message": f"❌ Error generating audio: {str(e)}",
+            "audio_url": None,
+            "text_preview": preview50
+        })
+
+AUDIO_CHUNK_SIZE = 64 * 1024
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """(start, end) half-open range for a single "bytes=" Range header, or None to send everything"""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start, _, end = range_header[6:].strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size
+        first = int(start)
+        last = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size or first > last:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return first, last + 1
+
+def iter_in_chunks(data: bytes, start: int, end: int):
+    view = memoryview(data)
+    for offset in range(start, end, AUDIO_CHUNK_SIZE):
+        yield bytes(view[offset:min(offset + AUDIO_CHUNK_SIZE, end)])
+
+def audio_bytes_response(audio_bytes: bytes, range_header: Optional[str], headers: Optional[dict] = None):
+    """Stream in-memory MP3 bytes in 64 KB chunks, honoring a single byte Range"""
+    size = len(audio_bytes)
+    headers = {"Accept-Ranges": "bytes", **(headers or {})}
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        start, end, status_code = 0, size, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(
+        iter_in_chunks(audio_bytes, start, end),
+        status_code=status_code,
+        media_type="audio/mpeg",
+        headers=headers
+    )
+
+async def entry_audio(audio_data: AudioEntry) -> tuple:
+    """(local path, audio bytes) for an entry; exactly one is used to serve it"""
+    # Entries shared through Redis may point at another host's disk or a recreated volume,
+    # so a missing file is refilled from this host's cache or from S3 before giving up
+    if audio_data.path and touch_cached_file(audio_data.path):
+        return audio_data.path, None
+    if audio_data.audio is not None:
+        return None, audio_data.audio
+    if audio_data.key:
+        path = cached_audio_path(audio_data.key)
+        if path is not None:
+            return path, None
+        loop = asyncio.get_running_loop()
+        audio_bytes = await loop.run_in_executor(_tts_executor, fetch_shared_audio, audio_data.key)
+        if audio_bytes is not None:
+            path = write_cached_audio(audio_data.key, audio_bytes)
+            if path is not None:
+                loop.run_in_executor(_tts_executor, write_audio_variants, audio_data.key, audio_bytes)
+            return path, audio_bytes
+    raise HTTPException(status_code=404, detail="Audio not found")
+
+# "high" is the synthesized MP3 as-is; in-memory entries only have that one
+AudioQuality = Literal["high", "med", "low"]
 
 @app.get("/api/tts/audio/{id}/download")
-async def download_audio(id: str):
+async def download_audio(id: str, quality: AudioQuality = "high", range: Optional[str] = Header(None)):
     """Download the generated audio file"""
-    if id not in audio_storage:
+    audio_data = await audio_storage.get(id)
+    if audio_data is None:
         raise HTTPException(status_code=404, detail="Audio not found")
     
-    audio_data = audio_storage[id]
-    audio_bytes = audio_data["audio"]
+    path, audio_bytes = await entry_audio(audio_data)
+    if path:
+        # Sent from the disk cache with sendfile; FileResponse handles Range and sets the attachment name
+        return FileResponse(variant_path(path, quality), media_type="audio/mpeg",
+                            filename=f"speech_{id}.mp3")
     
-    return Response(
-        content=audio_bytes,
-        media_type="audio/mpeg",
-        headers={
-            "Content-Disposition": f'attachment; filename="speech_{id}.mp3"'
-        }
-    )
+    return audio_bytes_response(audio_bytes, range, {
+        "Content-Disposition": f'attachment; filename="speech_{id}.mp3"'
+    })
 
 @app.get("/api/tts/audio/{id}/stream")
-async def stream_audio(id: str):
-    """Stream the audio for playback"""
-    if id not in audio_storage:
+async def stream_audio(id: str, quality: AudioQuality = "high", range: Optional[str] = Header(None)):
+    """Stream the audio for playback (supports Range requests for seeking)"""
+    audio_data = await audio_storage.get(id)
+    if audio_data is None:
         raise HTTPException(status_code=404, detail="Audio not found")
     
-    audio_data = audio_storage[id]
-    audio_bytes = audio_data["audio"]
+    path, audio_bytes = await entry_audio(audio_data)
+    if path:
+        # FileResponse serves Range requests itself and sends the file with sendfile
+        return FileResponse(variant_path(path, quality), media_type="audio/mpeg")
     
-    return Response(
-        content=audio_bytes,
-        media_type="audio/mpeg"
-    )
+    return audio_bytes_response(audio_bytes, range)
 
 @app.get("/api/tts/audio/{id}")
 async def get_audio_info(id: str):
     """Get audio info"""
-    if id not in audio_storage:
+    data = await audio_storage.get(id)
+    if data is None:
         raise HTTPException(status_code=404, detail="Audio not found")
     
-    data = audio_storage[id]
     return {
         "id": id,
-        "text_preview": data["text"][:100],
-        "language": data["language"],
+        "text_preview": data.text[:100],
+        "language": data.language,
         "audio_url": f"/api/tts/audio/{id}/stream",
         "download_url": f"/api/tts/audio/{id}/download",
-        "created_at": data["created_at"]
+        "created_at": data.created_at
     }
 
 @app.delete("/api/tts/audio/{id}")
 async def delete_audio(id: str):
     """Delete audio"""
-    if id in audio_storage:
-        del audio_storage[id]
+    if await audio_storage.delete(id):
         return {"message": "Audio deleted", "id": id}
     raise HTTPException(status_code=404, detail="Audio not found")
 
+@app.on_event("shutdown")
+def flush_kafka():
+    """Deliver queued and buffered Kafka messages before the process exits"""
+    app.state.kafka_drain_task.cancel()
+    pending = []
+    while not _kafka_queue.empty():
+        pending.append(_kafka_queue.get_nowait())
+    send_completion_events(pending)
+    kafka_handler.flush()
+
+@app.on_event("shutdown")
+async def close_audio_storage():
+    await audio_storage.close()
+
 @app.get("/health")
 async def health():
     return {"status": "healthy", "service": "tts", "version": "2.0"}
@@ -1,45 +1,66 @@
+import io
 import os
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from gtts import gTTS
 
 from services.common.kafka_handler import KafkaHandler
 from services.common.s3_handler import S3Handler
+from services.tts_service.cache import cache_key, gtts_language, normalize_text, s3_key
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 TTS_S3_BUCKET = os.getenv("TTS_S3_BUCKET", "tts-service-storage-dev")
+TTS_WORKER_THREADS = int(os.getenv("TTS_WORKER_THREADS", "16"))
 
 kafka_handler = KafkaHandler(KAFKA_BOOTSTRAP_SERVERS)
 s3_handler = S3Handler(TTS_S3_BUCKET)
 
-def process_tts_request():
-    consumer = kafka_handler.get_consumer("audio.generation.requested", "tts_worker_group")
+# Each synthesis is mostly waiting on gTTS over HTTPS, so a batch runs concurrently
+executor = ThreadPoolExecutor(max_workers=TTS_WORKER_THREADS)
+
+def synthesize_and_upload(data):
+    request_id = data.get("id")
+    text = normalize_text(data.get("text"))
+    lang = gtts_language(data.get("language", "en"))
     
-    for message in consumer:
-        data = message.value
-        request_id = data.get("id")
-        text = data.get("text")
-        lang = data.get("language", "en")
-        
-        # Generate speech
+    # Same content-addressed key as the HTTP service, so either path reuses the other's audio
+    object_name = s3_key(cache_key(text, lang))
+    if not s3_handler.object_exists(object_name):
+        # Generate speech into memory
         tts = gTTS(text=text, lang=lang)
-        local_path = f"{request_id}.mp3"
-        tts.save(local_path)
+        audio_buffer = io.BytesIO()
+        tts.write_to_fp(audio_buffer)
+        audio_buffer.seek(0)
         
-        # Upload to S3
-        s3_key = f"generated/{request_id}.mp3"
-        if s3_handler.upload_file(local_path, s3_key):
-            # Send completion message
-            kafka_handler.send_message("audio.generation.completed", {
-                "id": request_id,
-                "s3_path": s3_key,
-                "status": "completed"
-            })
-            
-        # Cleanup
-        if os.path.exists(local_path):
-            os.remove(local_path)
+        # Upload to S3 straight from the buffer
+        if not s3_handler.upload_fileobj(audio_buffer, object_name):
+            return
+    
+    # Send completion message
+    kafka_handler.send_message("audio.generation.completed", {
+        "id": request_id,
+        "s3_path": object_name,
+        "status": "completed"
+    })
+
+def synthesize_and_upload_safe(data):
+    try:
+        synthesize_and_upload(data)
+    except Exception as e:
+        print(f"TTS error for {data.get('id')}: {e}")
+
+def process_tts_request():
+    consumer = kafka_handler.get_consumer("audio.generation.requested", "tts_worker_group", enable_auto_commit=False)
+    
+    # Synthesize a polled batch in parallel, then commit its offsets once
+    while True:
+        records = consumer.poll(timeout_ms=500, max_records=32)
+        if not records:
+            continue
+        batch = [message.value for messages in records.values() for message in messages]
+        list(executor.map(synthesize_and_upload_safe, batch))
+        consumer.commit()
 
 if __name__ == "__main__":
     process_tts_request()
-Line 1: # tts_service/worker.py
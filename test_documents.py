@@ -0,0 +1,24 @@
+import asyncio
+import os
+import tempfile
+
+from services.document_service import main as document_main
+
+def test_large_text_stays_inline_when_s3_upload_fails(monkeypatch):
+    text = "word " * 300_000
+    fd, text_path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "wb") as f:
+        f.write(text.encode("utf-8"))
+
+    def failing_upload(fileobj, object_name):
+        # boto3 closes the file object when a transfer fails
+        fileobj.close()
+        return False
+
+    monkeypatch.setattr(document_main.s3_handler, "upload_fileobj", failing_upload)
+
+    result = {"text_data": None, "text_path": text_path}
+    text_ref = asyncio.run(document_main.store_extracted_text("digest", "txt", result))
+
+    assert text_ref == {"text": text}
+    assert not os.path.exists(text_path)